@@ -0,0 +1,147 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, dumpling development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+
+'''Benchmarks of the Python-side overhead and the spawn throughput of dumpling.
+
+They are written for asv. Run ``asv run`` to benchmark the commits or
+``asv continuous master HEAD`` to compare a change against master. The
+``subprocess`` counterparts time the same commands run with
+:func:`subprocess.run`, so the difference is the overhead per invocation.
+'''
+
+import shutil
+import subprocess
+from subprocess import PIPE
+
+from dumpling import (
+    ArgmntParam, OptionParam, Parameters, SpooledOutput, check_choice, check_range,
+    dumpling_factory)
+
+
+def _params(n):
+    '''Return n validated option params followed by an argument param.'''
+    params = [OptionParam('--opt{}'.format(i), value=i, action=check_range(0, n))
+              for i in range(n - 1)]
+    params.append(ArgmntParam('input', value='input.txt'))
+    return params
+
+
+class ParametersSuite:
+    '''The cost of defining, copying, updating and rendering parameters.'''
+    params = [10, 100, 1000]
+    param_names = ['n_params']
+
+    def setup(self, n):
+        self.params_list = _params(n)
+        self.parameters = Parameters(*self.params_list)
+        self.App = dumpling_factory('true', shutil.which('true'), self.parameters)
+        self.app = self.App()
+        self.kwargs = {'opt{}'.format(i): n - i for i in range(n - 1)}
+
+    def time_parameters(self, n):
+        Parameters(*self.params_list)
+
+    def time_factory(self, n):
+        dumpling_factory('true', 'true', self.parameters)
+
+    def time_instantiate(self, n):
+        self.App()
+
+    def time_command(self, n):
+        self.app.command
+
+    def time_command_changed(self, n):
+        self.app.update(opt0=1)
+        self.app.command
+        self.app.update(opt0=0)
+        self.app.command
+
+    def time_update(self, n):
+        self.app.update(**self.kwargs)
+
+    def time_sweep(self, n):
+        for _ in self.app.sweep(opt0=range(n - 1)):
+            pass
+
+    def time_call(self, n):
+        self.app()
+
+
+class CheckSuite:
+    '''The cost of validating values.'''
+    def setup(self):
+        self.check_range = check_range(0, 100)
+        self.check_choice = check_choice(range(100))
+
+    def time_check_range(self):
+        self.check_range(50)
+
+    def time_check_choice(self):
+        self.check_choice(50)
+
+
+class SpawnSuite:
+    '''The invocation overhead of a command doing nothing.'''
+    def setup(self):
+        self.true = shutil.which('true')
+        self.app = dumpling_factory('true', 'true', Parameters())()
+
+    def time_call(self):
+        self.app()
+
+    def time_subprocess(self):
+        subprocess.run([self.true], stdout=PIPE, stderr=PIPE)
+
+
+class OutputSuite:
+    '''The cost of capturing output of increasing size.'''
+    params = [2 ** 10, 2 ** 20, 2 ** 30]
+    param_names = ['size']
+    timeout = 600
+
+    def setup(self, size):
+        Head = dumpling_factory('head', ['head', '-c'],
+                                Parameters(ArgmntParam('size'), ArgmntParam('file')))
+        self.app = Head()
+        self.app.update(size=size, file='/dev/zero')
+
+    def time_call(self, size):
+        self.app()
+
+    def time_call_bytes(self, size):
+        self.app(text=False)
+
+    def time_call_spooled(self, size):
+        with SpooledOutput() as out:
+            self.app(stdout=out)
+
+    def time_subprocess(self, size):
+        subprocess.run(self.app.command, stdout=PIPE, stderr=PIPE)
+
+    def peakmem_call_bytes(self, size):
+        self.app(text=False)
+
+    def peakmem_call_spooled(self, size):
+        with SpooledOutput() as out:
+            self.app(stdout=out)
+
+
+class InputSuite:
+    '''The cost of feeding input of increasing size.'''
+    params = [2 ** 10, 2 ** 20, 2 ** 27]
+    param_names = ['size']
+
+    def setup(self, size):
+        self.app = dumpling_factory('cat', 'cat', Parameters())()
+        self.data = bytes(size)
+
+    def time_call(self, size):
+        self.app(input=self.data, stdout=subprocess.DEVNULL)
+
+    def time_subprocess(self, size):
+        subprocess.run(['cat'], input=self.data, stdout=subprocess.DEVNULL, stderr=PIPE)
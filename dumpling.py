@@ -7,6 +7,7 @@ Functions
    :toctree: _autosummary
 
    dumpling_factory
+   from_help
    check_choice
    check_range
 
@@ -17,22 +18,58 @@ Classes
 
    Param
    ArgmntParam
+   ArgmntListParam
    OptionParam
    Parameters
+   BatchRunner
+   ProcessStream
+   ResultCache
+   PipeInput
+   Pipeline
+   SlotScheduler
+   BatchJournal
+   ResourceUsage
+   CancelHandle
+   ProcessCancelled
+   RetryPolicy
+   SingleFlight
+   SpooledOutput
+   TraceEvent
+   JSONLinesTrace
+   ChromeTrace
 
 Inheritance diagram
 -------------------
-.. inheritance-diagram:: Parameters Param ArgmntParam OptionParam
+.. inheritance-diagram:: Parameters Param ArgmntParam ArgmntListParam OptionParam
 
 '''
 
 
 from keyword import iskeyword
-from collections import OrderedDict
+from collections import OrderedDict, deque, namedtuple
 from collections.abc import Mapping
 from abc import ABC, abstractmethod
-from subprocess import run, PIPE
+from subprocess import (
+    Popen, PIPE, DEVNULL, CompletedProcess, CalledProcessError, SubprocessError, TimeoutExpired)
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError, wait, FIRST_COMPLETED
+from itertools import count, islice, product
+from contextlib import contextmanager
 from copy import deepcopy
+from hashlib import sha256
+from tempfile import mkdtemp, NamedTemporaryFile
+import asyncio
+import io
+import json
+import locale
+import mmap
+import os
+import random
+import re
+import shutil
+import signal
+import sys
+import threading
+import time
 
 
 __version__ = '0.1.3'
@@ -147,6 +184,939 @@ def check_range(minimum, maximum):
     return func
 
 
+@contextmanager
+def _std_files(stdin, stdout, stderr):
+    '''Open the standard IO streams given as file paths.
+
+    All the streams but the capture buffers are closed on exit.
+
+    Yields
+    ------
+    list
+        The stdin, stdout and stderr to pass to the child process.
+    '''
+    files = [stdin, stdout, stderr]
+    try:
+        for i, mode in enumerate(('r', 'w+', 'w+')):
+            if isinstance(files[i], str):
+                files[i] = open(files[i], mode)
+        yield files
+    finally:
+        for f in files:
+            if _is_capture(f):
+                continue
+            try:
+                f.close()
+            except AttributeError:
+                pass
+
+
+def _decode(data):
+    '''Decode the captured output the same way as `universal_newlines=True`.'''
+    if data is None:
+        return None
+    text = data.decode(locale.getpreferredencoding(False))
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+class _Worker(threading.Thread):
+    '''Thread that keeps the return value or the exception of its target.'''
+    def __init__(self, target, *args):
+        super().__init__(daemon=True)
+        self._func = target
+        self._func_args = args
+        self._result = None
+        self._error = None
+        self.start()
+
+    def run(self):
+        try:
+            self._result = self._func(*self._func_args)
+        except BaseException as e:
+            self._error = e
+
+    def get(self):
+        '''Wait for the thread and return the result or raise the exception.'''
+        self.join()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+def _chunks(data):
+    '''Yield the input data as chunks of bytes.'''
+    if isinstance(data, (str, bytes, bytearray, memoryview)):
+        chunks = [data]
+    elif hasattr(data, 'read'):
+        chunks = iter(lambda: data.read(1 << 16), data.read(0))
+    else:
+        chunks = data
+    encoding = locale.getpreferredencoding(False)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode(encoding)
+        yield chunk
+
+
+def _feed(pipe, data):
+    '''Write the input data into the pipe and close it.
+
+    The writes block while the pipe is full, so the data is only pulled
+    as fast as the child reads it.'''
+    try:
+        if data is not None:
+            for chunk in _chunks(data):
+                pipe.write(chunk)
+    except BrokenPipeError:
+        # the child quits without reading all the input
+        pass
+    finally:
+        try:
+            pipe.close()
+        except BrokenPipeError:
+            pass
+
+
+def _read(pipe):
+    '''Read all the data from the pipe.'''
+    with pipe:
+        return pipe.read()
+
+
+def _is_capture(obj):
+    '''Return True if the output is to be captured into the object.
+
+    It is a writable buffer or a :class:`.SpooledOutput`.'''
+    return isinstance(obj, (bytearray, memoryview, mmap.mmap, SpooledOutput))
+
+
+def _readinto(pipe, buf):
+    '''Read all the data from the pipe directly into the buffer.
+
+    A `bytearray` grows as needed and is truncated to the data read. Other
+    buffers have a fixed size and `BufferError` is raised if the data
+    does not fit.
+
+    Returns
+    -------
+    bytearray or memoryview
+        The bytearray itself or the view of the part of the buffer filled.
+    '''
+    growable = isinstance(buf, bytearray)
+    view = memoryview(buf).cast('B')
+    n = overflow = 0
+    with pipe:
+        while True:
+            if n == len(view):
+                if not growable:
+                    # drain the pipe so the child does not block on it
+                    overflow = len(pipe.read())
+                    break
+                view.release()
+                buf.extend(bytes(max(n, io.DEFAULT_BUFFER_SIZE)))
+                view = memoryview(buf)
+            size = pipe.readinto(view[n:])
+            if not size:
+                break
+            n += size
+    if overflow:
+        raise BufferError('Output of {} bytes exceeds the buffer of {} bytes.'.format(
+            n + overflow, n))
+    if growable:
+        view.release()
+        del buf[n:]
+        return buf
+    return view[:n]
+
+
+def _new_capture(obj):
+    '''Return an empty object to capture a part of the output joined into `obj` later.'''
+    if isinstance(obj, SpooledOutput):
+        return SpooledOutput(obj.max_size, obj.dir)
+    return bytearray()
+
+
+def _join_into(buf, parts):
+    '''Concatenate the parts into the buffer the same way as :func:`_readinto`.'''
+    if isinstance(buf, SpooledOutput):
+        return buf._join(parts)
+    if isinstance(buf, bytearray):
+        del buf[:]
+        for part in parts:
+            buf += part
+        return buf
+    view = memoryview(buf).cast('B')
+    size = sum(len(part) for part in parts)
+    if size > len(view):
+        raise BufferError('Output of {} bytes exceeds the buffer of {} bytes.'.format(
+            size, len(view)))
+    n = 0
+    for part in parts:
+        view[n:n + len(part)] = part
+        n += len(part)
+    return view[:n]
+
+
+class SpooledOutput:
+    '''Output captured in memory up to a size and spilled to a temporary file beyond it.
+
+    Pass it as the stdout or stderr of a run. Small outputs are kept in
+    memory while large ones are written to a temporary file as they are
+    read, so a run never holds more than `max_size` bytes of output in
+    memory. The content is accessed the same way in both cases.
+
+    Parameters
+    ----------
+    max_size : int
+        The maximal size in bytes kept in memory.
+    dir : str, optional
+        The directory to create the temporary file in.
+
+    Examples
+    --------
+    >>> from dumpling import Parameters, SpooledOutput, dumpling_factory
+    >>> Seq = dumpling_factory('seq', ['seq', '3'], Parameters())
+    >>> out = SpooledOutput(max_size=4)
+    >>> Seq()(stdout=out).stdout is out
+    True
+    >>> out.spilled, len(out)
+    (True, 6)
+    >>> out.read()
+    b'1\\n2\\n3\\n'
+    >>> with out.open(text=True) as f:
+    ...     [int(line) for line in f]
+    [1, 2, 3]
+    >>> out.close()
+    '''
+    def __init__(self, max_size=2 ** 20, dir=None):
+        self.max_size = max_size
+        self.dir = dir
+        self._data = b''
+        self._file = None
+
+    def __repr__(self):
+        return '{}(max_size={!r}, size={}, spilled={})'.format(
+            self.__class__.__name__, self.max_size, len(self), self.spilled)
+
+    def __len__(self):
+        '''Return the size of the output.'''
+        if self._file is None:
+            return len(self._data)
+        return os.fstat(self._file.fileno()).st_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def spilled(self):
+        '''True if the output is in the temporary file.'''
+        return self._file is not None
+
+    @property
+    def name(self):
+        '''The path of the temporary file, or `None` if the output is in memory.'''
+        return None if self._file is None else self._file.name
+
+    def close(self):
+        '''Discard the output and remove the temporary file.'''
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._data = b''
+
+    def _capture(self, pipe):
+        '''Read all the data from the pipe, spilling it to disk when it gets large.'''
+        self.close()
+        buf = io.BytesIO()
+        with pipe:
+            while True:
+                chunk = pipe.read1(io.DEFAULT_BUFFER_SIZE)
+                if not chunk:
+                    self._data = buf.getvalue()
+                    break
+                if buf.tell() + len(chunk) > self.max_size:
+                    self._file = NamedTemporaryFile(prefix='dumpling-', dir=self.dir)
+                    self._file.write(buf.getbuffer())
+                    self._file.write(chunk)
+                    shutil.copyfileobj(pipe, self._file)
+                    self._file.flush()
+                    break
+                buf.write(chunk)
+        return self
+
+    def _join(self, parts):
+        '''Concatenate the outputs of the parts and close them.'''
+        self.close()
+        if len(parts) == 1:
+            # take over the output of the part without copying it
+            part = parts[0]
+            self._data, self._file = part._data, part._file
+            part._data, part._file = b'', None
+        elif sum(len(part) for part in parts) <= self.max_size:
+            self._data = b''.join(part.read() for part in parts)
+        else:
+            self._file = NamedTemporaryFile(prefix='dumpling-', dir=self.dir)
+            for part in parts:
+                with part.open() as f:
+                    shutil.copyfileobj(f, self._file)
+            self._file.flush()
+        for part in parts:
+            part.close()
+        return self
+
+    def open(self, text=False):
+        '''Return a new file object reading the output from the start.
+
+        Parameters
+        ----------
+        text : bool
+            Return a text file decoding the output the same way as the
+            text output captured in memory.
+        '''
+        if self._file is None:
+            f = io.BytesIO(self._data)
+        else:
+            f = open(self._file.name, 'rb')
+        if text:
+            return io.TextIOWrapper(f, locale.getpreferredencoding(False))
+        return f
+
+    def read(self):
+        '''Return the whole output as bytes.'''
+        if self._file is None:
+            return self._data
+        with self.open() as f:
+            return f.read()
+
+    def view(self):
+        '''Return a memoryview of the output, memory mapping the temporary file.'''
+        if self._file is None or len(self) == 0:
+            return memoryview(self._data)
+        return memoryview(mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class ResourceUsage(namedtuple('ResourceUsage', ['wall_time', 'user_time', 'sys_time',
+                                                 'max_rss', 'read_bytes', 'write_bytes'])):
+    '''Resources used by a run of a command.
+
+    The CPU times and the peak memory include those of the descendants
+    the command waited for.
+
+    Attributes
+    ----------
+    wall_time : float
+        Seconds elapsed from spawning to reaping the command.
+    user_time, sys_time : float or None
+        Seconds of user and system CPU time.
+    max_rss : int or None
+        The peak resident set size in bytes.
+    read_bytes, write_bytes : int or None
+        The bytes read and written by the command through system calls,
+        including from/to the page cache, pipes and terminals. They are
+        only available on Linux.
+    '''
+    __slots__ = ()
+
+
+def _wait(proc, exited=None):
+    '''Reap the child and return its rusage and I/O counters.
+
+    The child is waited for without being reaped first, so that its I/O
+    counters can still be read from /proc, and then it is reaped with
+    :func:`os.wait4` to get its rusage. The callable `exited` is called
+    in between, while the pid can not be reused yet.
+
+    Returns
+    -------
+    tuple
+        The rusage (or None if it is unavailable) and the bytes read and
+        written (or None).
+    '''
+    rchar = wchar = None
+    if not hasattr(os, 'wait4'):
+        proc.wait()
+        if exited is not None:
+            exited()
+        return None, rchar, wchar
+    try:
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        with open('/proc/{}/io'.format(proc.pid)) as f:
+            counters = dict(line.split(':') for line in f)
+        rchar, wchar = int(counters['rchar']), int(counters['wchar'])
+    except (AttributeError, OSError, KeyError, ValueError):
+        pass
+    if exited is not None:
+        exited()
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        proc.wait()
+        return None, rchar, wchar
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return rusage, rchar, wchar
+
+
+def _usage(start, rusage, rchar, wchar):
+    '''Return the ResourceUsage of a run.'''
+    wall_time = time.perf_counter() - start
+    if rusage is None:
+        return ResourceUsage(wall_time, None, None, None, rchar, wchar)
+    max_rss = rusage.ru_maxrss
+    if sys.platform != 'darwin':
+        # it is in kilobytes except on macOS
+        max_rss *= 1024
+    return ResourceUsage(wall_time, rusage.ru_utime, rusage.ru_stime, max_rss, rchar, wchar)
+
+
+class ProcessCancelled(SubprocessError):
+    '''Raised when a run is cancelled with a :class:`.CancelHandle`.
+
+    Attributes
+    ----------
+    cmd : list of str
+        The command args list.
+    output, stderr : str, bytes or None
+        The output captured before the command was killed.
+    '''
+    def __init__(self, cmd, output=None, stderr=None):
+        self.cmd = cmd
+        self.output = output
+        self.stderr = stderr
+
+    @property
+    def stdout(self):
+        return self.output
+
+    def __str__(self):
+        return 'Command {!r} was cancelled'.format(self.cmd)
+
+
+class RetryPolicy:
+    '''Policy to retry the runs failing transiently.
+
+    A failed run is transient if its return code is one of `returncodes`
+    or its captured stderr matches the `stderr` pattern. If neither is
+    given, any non-zero return code is transient. The attempts are
+    delayed with exponential backoff and random jitter.
+
+    Parameters
+    ----------
+    attempts : int
+        The maximal number of attempts, including the first one.
+    returncodes : ~collections.abc.Iterable of int, optional
+        The return codes of transient failures.
+    stderr : str or re.Pattern, optional
+        The regular expression searched in the stderr of transient
+        failures, e.g. ``'Stale file handle|license server'``.
+    timeouts : bool
+        Retry the runs killed on timeout as well.
+    backoff : float
+        The seconds to wait before the second attempt.
+    factor : float
+        The multiplier of the wait for each further attempt.
+    max_backoff : float
+        The maximal seconds to wait between attempts.
+    jitter : float
+        The fraction of each wait that is randomly cut, from 0 (no
+        jitter) to 1, so that the failed runs of a batch do not retry
+        all at the same time.
+
+    Examples
+    --------
+    >>> from dumpling import Parameters, RetryPolicy, dumpling_factory
+    >>> Flaky = dumpling_factory('flaky', ['sh', '-c', 'echo busy >&2; exit 75'], Parameters())
+    >>> proc = Flaky()(retry=RetryPolicy(3, returncodes=[75], backoff=0.01), check=False)
+    >>> [(a.returncode, a.stderr) for a in proc.attempts]
+    [(75, 'busy\\n'), (75, 'busy\\n'), (75, 'busy\\n')]
+    '''
+    def __init__(self, attempts=3, returncodes=None, stderr=None, timeouts=False,
+                 backoff=1, factor=2, max_backoff=60, jitter=0.5):
+        if attempts < 1:
+            raise ValueError('The attempts must be at least 1.')
+        if not 0 <= jitter <= 1:
+            raise ValueError('The jitter must be between 0 and 1.')
+        self.attempts = attempts
+        self.returncodes = None if returncodes is None else frozenset(returncodes)
+        self.stderr = None if stderr is None else re.compile(stderr)
+        self.timeouts = timeouts
+        self.backoff = backoff
+        self.factor = factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    def __repr__(self):
+        return ('{}(attempts={!r}, returncodes={!r}, stderr={!r}, timeouts={!r}, backoff={!r}, '
+                'factor={!r}, max_backoff={!r}, jitter={!r})').format(
+                    self.__class__.__name__, self.attempts,
+                    None if self.returncodes is None else sorted(self.returncodes),
+                    None if self.stderr is None else self.stderr.pattern, self.timeouts,
+                    self.backoff, self.factor, self.max_backoff, self.jitter)
+
+    def transient(self, result):
+        '''Return True if the failed run is worth retrying.
+
+        Parameters
+        ----------
+        result : `subprocess.CompletedProcess` or `subprocess.TimeoutExpired`
+            The result of the failed attempt.
+        '''
+        if isinstance(result, TimeoutExpired):
+            return self.timeouts
+        if not result.returncode:
+            return False
+        if self.returncodes is None and self.stderr is None:
+            return True
+        if self.returncodes is not None and result.returncode in self.returncodes:
+            return True
+        err = result.stderr
+        if isinstance(err, SpooledOutput):
+            err = err.read()
+        elif isinstance(err, (bytearray, memoryview)):
+            err = bytes(err)
+        if self.stderr is not None and isinstance(err, (str, bytes)):
+            if isinstance(err, bytes):
+                err = err.decode(errors='replace')
+            return self.stderr.search(err) is not None
+        return False
+
+    def delay(self, attempt):
+        '''Return the seconds to wait after the failed attempt (1-based).'''
+        wait = min(self.max_backoff, self.backoff * self.factor ** (attempt - 1))
+        return wait * (1 - self.jitter * random.random())
+
+
+class CancelHandle:
+    '''Handle to cancel runs from another thread.
+
+    The same handle can be given to any number of runs, e.g. all the
+    runs of a batch. Cancelling it kills all the runs that are going on
+    as well as those started later.
+
+    Examples
+    --------
+    >>> import threading
+    >>> from dumpling import ArgmntParam, Parameters, CancelHandle, dumpling_factory
+    >>> Sleep = dumpling_factory('sleep', 'sleep', Parameters(ArgmntParam('seconds', 60)))
+    >>> handle = CancelHandle()
+    >>> threading.Timer(0.1, handle.cancel).start()
+    >>> Sleep()(cancel=handle)  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+     ...
+    dumpling.ProcessCancelled: Command ['sleep', '60'] was cancelled
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks = set()
+
+    @property
+    def cancelled(self):
+        '''True if the handle is cancelled.'''
+        return self._cancelled
+
+    def cancel(self):
+        '''Kill the runs using this handle.'''
+        with self._lock:
+            self._cancelled = True
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def _register(self, callback):
+        '''Call the callback on cancellation, immediately if it is already cancelled.'''
+        with self._lock:
+            self._callbacks.add(callback)
+            cancelled = self._cancelled
+        if cancelled:
+            callback()
+
+    def _unregister(self, callback):
+        with self._lock:
+            self._callbacks.discard(callback)
+
+    def _wait(self, timeout):
+        '''Wait at most `timeout` seconds for the cancellation; return True if cancelled.'''
+        event = threading.Event()
+        self._register(event.set)
+        try:
+            return event.wait(timeout)
+        finally:
+            self._unregister(event.set)
+
+
+def _killpg(proc, sig):
+    '''Send the signal to the process group of the child.'''
+    try:
+        os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+class _Watchdog(threading.Thread):
+    '''Kill the process group of the child on timeout or cancellation.
+
+    The group is sent SIGTERM first and SIGKILL after the grace period if
+    the child does not exit in time.'''
+    def __init__(self, proc, timeout=None, cancel=None, grace=5):
+        super().__init__(daemon=True)
+        self.proc = proc
+        self.timeout = timeout
+        self.cancel = cancel
+        self.grace = grace
+        # the reason to kill the child: 'timeout' or 'cancel'
+        self.reason = None
+        self._wake = threading.Event()
+        self._exited = threading.Event()
+        # held while signalling so that the child is not reaped meanwhile
+        self._lock = threading.Lock()
+        if cancel is not None:
+            cancel._register(self._cancel)
+        self.start()
+
+    def _cancel(self):
+        if self.reason is None:
+            self.reason = 'cancel'
+        self._wake.set()
+
+    def _signal(self, sig):
+        with self._lock:
+            if not self._exited.is_set():
+                _killpg(self.proc, sig)
+
+    def run(self):
+        if not self._wake.wait(self.timeout):
+            self.reason = 'timeout'
+        elif self.reason is None:
+            return
+        self._signal(signal.SIGTERM)
+        if not self._exited.wait(self.grace):
+            self._signal(signal.SIGKILL)
+
+    def exited(self):
+        '''Stop watching the child before it is reaped.'''
+        with self._lock:
+            self._exited.set()
+        self._wake.set()
+        if self.cancel is not None:
+            self.cancel._unregister(self._cancel)
+
+
+class TraceEvent(namedtuple('TraceEvent', ['event', 'time', 'app', 'run', 'args', 'pid',
+                                           'thread', 'returncode'])):
+    '''Event of a run passed to the hooks of an app class.
+
+    The events of a run are, in order:
+
+    ``'start'``
+        The app is called.
+    ``'pre_spawn'``
+        The command is rendered and is about to be spawned.
+    ``'post_spawn'``
+        The child process is spawned.
+    ``'first_byte'``
+        The first byte of the stdout captured in memory is available.
+    ``'exit'``
+        The child process is reaped.
+    ``'end'``
+        The call returns or raises, after the output is decoded.
+
+    The events from ``'pre_spawn'`` to ``'exit'`` are missing if the
+    command is not run, e.g. its result is cached.
+
+    Attributes
+    ----------
+    event : str
+        The event name.
+    time : int
+        The :func:`time.perf_counter_ns` timestamp in nanoseconds.
+    app : str
+        The name of the app class.
+    run : int
+        The id shared by the events of the same run.
+    args : list of str or None
+        The command args list, or `None` before it is rendered.
+    pid : int or None
+        The process id of the child.
+    thread : int
+        The id of the thread calling the app.
+    returncode : int or None
+        The return code on ``'exit'`` and ``'end'``.
+    '''
+    __slots__ = ()
+
+
+# the ids of the traced runs
+_run_ids = count()
+
+
+class JSONLinesTrace:
+    '''Hook writing the events as JSON lines into a file.
+
+    Parameters
+    ----------
+    path : str
+        The file to append the events to.
+
+    Examples
+    --------
+    >>> import json
+    >>> from tempfile import mkdtemp
+    >>> from shutil import rmtree
+    >>> from os.path import join
+    >>> from dumpling import Parameters, JSONLinesTrace, dumpling_factory
+    >>> tmpd = mkdtemp()
+    >>> with JSONLinesTrace(join(tmpd, 'trace.jsonl')) as trace:
+    ...     _ = dumpling_factory('echo', 'echo', Parameters(), hooks=[trace])()()
+    >>> with open(join(tmpd, 'trace.jsonl')) as f:
+    ...     [json.loads(line)['event'] for line in f]
+    ['start', 'pre_spawn', 'post_spawn', 'first_byte', 'exit', 'end']
+    >>> rmtree(tmpd)
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+
+    def __call__(self, event):
+        line = json.dumps(event._asdict()) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        '''Flush and close the file.'''
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ChromeTrace:
+    '''Hook collecting the events in the Chrome trace event format.
+
+    Each run is shown as the spans of its phases: ``render`` (from
+    ``'start'`` to ``'pre_spawn'``), ``spawn`` (fork and exec), ``run``
+    (the command itself) and ``decode`` (reaping to return), on the
+    thread calling the app. The first byte of the output is shown as an
+    instant event. Open the file written on :meth:`close` in
+    ``chrome://tracing`` or Perfetto.
+
+    Parameters
+    ----------
+    path : str
+        The JSON file to write.
+    '''
+    _phases = [('render', 'start', 'pre_spawn'), ('spawn', 'pre_spawn', 'post_spawn'),
+               ('run', 'post_spawn', 'exit'), ('decode', 'exit', 'end')]
+
+    def __init__(self, path):
+        self.path = path
+        self.events = []
+        self._lock = threading.Lock()
+        # the events of the runs going on
+        self._runs = {}
+
+    def __call__(self, event):
+        with self._lock:
+            times = self._runs.setdefault(event.run, {})
+            times[event.event] = event
+            if event.event == 'first_byte':
+                self.events.append(self._trace_event(event, 'first_byte', 'i', event.time))
+            elif event.event == 'end':
+                del self._runs[event.run]
+                for name, begin, end in self._phases:
+                    if begin in times and end in times:
+                        self.events.append(self._trace_event(
+                            times[end], name, 'X', times[begin].time,
+                            dur=(times[end].time - times[begin].time) / 1000))
+
+    @staticmethod
+    def _trace_event(event, name, ph, time, **kwargs):
+        d = {'name': '{} {}'.format(event.app, name), 'cat': event.app, 'ph': ph,
+             'ts': time / 1000, 'pid': os.getpid(), 'tid': event.thread,
+             'args': {'run': event.run, 'args': event.args, 'pid': event.pid,
+                      'returncode': event.returncode}}
+        if ph == 'i':
+            d['s'] = 't'
+        d.update(kwargs)
+        return d
+
+    def close(self):
+        '''Write the collected events into the file.'''
+        with self._lock:
+            with open(self.path, 'w') as f:
+                json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _first_byte(first, read, pipe, *args):
+    '''Call `first` when the first byte is available in the pipe and then read it.'''
+    if pipe.peek(1):
+        first()
+    return read(pipe, *args)
+
+
+# the resolved executables by name and PATH
+_executables = {}
+
+
+def _resolve(name):
+    '''Return the absolute path of the executable found in PATH.
+
+    The path is cached until PATH or the mtime of the executable changes,
+    so the PATH search is not repeated on every spawn. The name is
+    returned unchanged if it is a path or is not found, leaving the error
+    to the spawn.
+    '''
+    if os.sep in name:
+        return name
+    path = os.environ.get('PATH', os.defpath)
+    key = (name, path)
+    cached = _executables.get(key)
+    if cached is not None:
+        try:
+            if os.stat(cached[0]).st_mtime_ns == cached[1]:
+                return cached[0]
+        except OSError:
+            pass
+    exe = shutil.which(name, path=path)
+    try:
+        exe = os.path.abspath(exe)
+        _executables[key] = exe, os.stat(exe).st_mtime_ns
+    except (TypeError, OSError):
+        _executables.pop(key, None)
+        return name
+    return exe
+
+
+def _run(args, cwd=None, stdin=PIPE, stdout=PIPE, stderr=PIPE, input=None, pipes=(),
+         text=True, timeout=None, cancel=None, grace=5, trace=None):
+    '''Run the command and wait for it to finish.
+
+    Unlike :func:`subprocess.run`, the input can be any data accepted by
+    :class:`.PipeInput`. It is written into the stdin in a thread while
+    the output is read in other threads, so the child never deadlocks on
+    a full pipe. The stdout and stderr can also be writable buffers the
+    output is read into without any intermediate copy, or
+    :class:`.SpooledOutput`. The child runs in
+    its own session, so that the whole process tree is killed on timeout
+    or cancellation. The callable `trace` is called with the event name,
+    the pid and the return code of the spawn events of
+    :class:`.TraceEvent`.
+
+    Returns
+    -------
+    `subprocess.CompletedProcess`
+        The stdout and stderr captured with `subprocess.PIPE` are decoded
+        if `text` is True; those captured into buffers are returned by
+        :func:`_readinto`. Its extra attribute `usage` is the
+        :class:`.ResourceUsage`.
+
+    Raises
+    ------
+    subprocess.TimeoutExpired
+        If the command does not finish in `timeout` seconds.
+    ProcessCancelled
+        If the run is cancelled.
+    '''
+    if input is not None and stdin is not PIPE:
+        raise ValueError('stdin and input arguments may not both be used.')
+    buffers = [f if _is_capture(f) else None for f in (stdout, stderr)]
+    stdout, stderr = [PIPE if b is not None else f for f, b in zip((stdout, stderr), buffers)]
+    if trace is not None:
+        trace('pre_spawn')
+    start = time.perf_counter()
+    try:
+        proc = Popen(args, executable=_resolve(args[0]), cwd=cwd, stdin=stdin, stdout=stdout,
+                     stderr=stderr, pass_fds=[p.fd for p in pipes], start_new_session=True)
+    except BaseException:
+        for p in pipes:
+            p._close()
+        raise
+    if trace is not None:
+        trace('post_spawn', proc.pid)
+    watchdog = None
+    with proc:
+        try:
+            if timeout is not None or cancel is not None:
+                watchdog = _Watchdog(proc, timeout, cancel, grace)
+            workers = [p._start() for p in pipes]
+            if proc.stdin is not None:
+                workers.append(_Worker(_feed, proc.stdin, input))
+            readers = []
+            for f, b in zip((proc.stdout, proc.stderr), buffers):
+                read = (_read, f) if b is None else (
+                    (b._capture, f) if isinstance(b, SpooledOutput) else (_readinto, f, b))
+                if f is None:
+                    readers.append(None)
+                elif trace is not None and f is proc.stdout:
+                    readers.append(_Worker(_first_byte, lambda: trace('first_byte', proc.pid),
+                                           *read))
+                else:
+                    readers.append(_Worker(*read))
+            out, err = [None if r is None else r.get() for r in readers]
+            for w in workers:
+                w.get()
+            usage = _usage(start, *_wait(proc, watchdog and watchdog.exited))
+        except BaseException:
+            if watchdog is not None:
+                watchdog.exited()
+            _killpg(proc, signal.SIGKILL)
+            raise
+    # the child is reaped, so its pid must not be signalled if a hook raises
+    if trace is not None:
+        trace('exit', proc.pid, proc.returncode)
+    if text:
+        out, err = [_decode(d) if b is None else d for d, b in zip((out, err), buffers)]
+    if watchdog is not None and watchdog.reason == 'timeout':
+        raise TimeoutExpired(args, timeout, out, err)
+    elif watchdog is not None and watchdog.reason == 'cancel':
+        raise ProcessCancelled(args, out, err)
+    result = CompletedProcess(args, proc.returncode, out, err)
+    result.usage = usage
+    return result
+
+
+class _Spec:
+    '''The static definition of a parameter shared by all its copies.
+
+    It is never changed once created; changing an attribute of a parameter
+    gives the parameter a new spec.'''
+    __slots__ = ('name', 'action', 'help', 'io', 'flag', 'alter', 'delimiter')
+
+    def __init__(self):
+        for k in self.__slots__:
+            setattr(self, k, None)
+
+    def _replace(self, **kwargs):
+        '''Return a new spec with the given attributes replaced.'''
+        new = object.__new__(_Spec)
+        for k in self.__slots__:
+            setattr(new, k, kwargs[k] if k in kwargs else getattr(self, k))
+        return new
+
+
+def _spec_attr(name, doc):
+    '''Return the property of an attribute stored in the spec.'''
+    def fget(self):
+        return getattr(self._spec, name)
+
+    def fset(self, v):
+        self._spec = self._spec._replace(**{name: v})
+    return property(fget, fset, doc=doc)
+
+
 class Param(ABC):
     '''Abstract base class for command line parameters.
 
@@ -162,28 +1132,56 @@ class Param(ABC):
         anything. See :func:`.check_choice` and :func:`.check_range`.
     help : str
         explanatory text for the parameter
+    io : {None, 'in', 'out'}
+        Declare the value of the parameter is an input or an output file
+        (or directory) path of the command.
+
+    Notes
+    -----
+    Only the value is stored in the parameter object itself. The other
+    attributes are stored in a spec object shared by all the copies of the
+    parameter, so a copy costs as little memory as an object can.
 
     See Also
     --------
     ArgmntParam
     OptionParam
     '''
-    def __init__(self, name, value=None, action=lambda i: i, help=''):
+    __slots__ = ('_spec', '_value')
+
+    def __init__(self, name, value=None, action=lambda i: i, help='', io=None):
+        self._spec = _Spec()
         self.name = name
         self.action = action
         self.value = value
         self.help = help
+        self.io = io
+
+    name = _spec_attr('name', '''The name of the parameter.''')
+    action = _spec_attr('action', '''The callable to operate on the value.''')
+    help = _spec_attr('help', '''The help message of the parameter.''')
+
+    @property
+    def io(self):
+        '''Whether the value is an input ('in') or output ('out') path.'''
+        return self._spec.io
+
+    @io.setter
+    def io(self, s):
+        if s not in (None, 'in', 'out'):
+            raise ValueError("Illegal io {!r}: it must be None, 'in' or 'out'.".format(s))
+        self._spec = self._spec._replace(io=s)
 
     @property
     def value(self):
         '''The value of the parameter.'''
-        return self.__value
+        return self._value
 
     @value.setter
     def value(self, v):
         if v is not None:
-            v = self.action(v)
-        self.__value = v
+            v = self._spec.action(v)
+        self._value = v
 
     def on(self, value):
         '''Set the value of the parameter.'''
@@ -219,10 +1217,42 @@ class Param(ABC):
     def _get_arg(self):
         '''Return the parameter as list.'''
 
+    def _io_repr(self):
+        '''Return the io part of the string representation.'''
+        if self.io is None:
+            return ''
+        return ', io={!r}'.format(self.io)
+
     def __eq__(self, other):
         '''Compare two parameters.'''
         return other.value == self.value
 
+    def _paths(self):
+        '''Return the value as the list of paths.'''
+        return [str(self.value)]
+
+    def _copy(self):
+        '''Return a copy of the parameter sharing the same spec.'''
+        new = object.__new__(self.__class__)
+        new._spec = self._spec
+        new._value = _copy_value(self._value)
+        # the attributes of a subclass without __slots__
+        attrs = getattr(self, '__dict__', None)
+        if attrs:
+            new.__dict__.update(attrs)
+        return new
+
+
+def _copy_value(value):
+    '''Return the value itself if it is immutable, otherwise a deep copy of it.
+
+    The copies of a param do not share a mutable value, e.g. a list, so
+    changing it in place only affects the param it is changed in.'''
+    if isinstance(value, (type(None), bool, int, float, complex, str, bytes, tuple, frozenset,
+                          PipeInput)):
+        return value
+    return deepcopy(value)
+
 
 class ArgmntParam(Param):
     '''Class of command line argument parameter.
@@ -241,6 +1271,8 @@ class ArgmntParam(Param):
         anything. See :func:`.check_choice` and :func:`.check_range`.
     help : str, optional
         The help or description message for the parameter.
+    io : {None, 'in', 'out'}, optional
+        Declare the value is an input or an output path of the command.
 
     Attributes
     ----------
@@ -248,6 +1280,7 @@ class ArgmntParam(Param):
     action
     value
     help
+    io
 
     Examples
     --------
@@ -275,6 +1308,8 @@ class ArgmntParam(Param):
     OptionParam
 
     '''
+    __slots__ = ()
+
     def __str__(self):
         '''Return the string of the parameter value.'''
         if self.is_off():
@@ -285,9 +1320,9 @@ class ArgmntParam(Param):
     def __repr__(self):
         '''Return the string representation of the argument parameter.'''
         # if isinstance(self.value, bool):
-        s = '{}(name={!r}, value={!r}, action={}, help={!r})'
+        s = '{}(name={!r}, value={!r}, action={}, help={!r}{})'
         return s.format(self.__class__.__name__, self.name, self.value,
-                        self.action.__name__, self.help)
+                        self.action.__name__, self.help, self._io_repr())
 
     def _get_arg(self):
         '''Return the parameter as list.'''
@@ -297,6 +1332,60 @@ class ArgmntParam(Param):
             return []
 
 
+class ArgmntListParam(ArgmntParam):
+    '''Class of command line argument parameter taking a list of values.
+
+    Each item of the value is passed as a separate argument, e.g. the
+    input files of a tool accepting any number of them. The value is
+    stored as a tuple and the `action` is applied to each item. Use
+    :meth:`Dumpling.xargs` to split a long list over several runs.
+
+    Examples
+    --------
+    >>> from dumpling import ArgmntListParam
+    >>> p = ArgmntListParam('files', ['a.txt', 'b.txt'], action=str.upper)
+    >>> p
+    ArgmntListParam(name='files', value=('A.TXT', 'B.TXT'), action=upper, help='')
+    >>> str(p)
+    'A.TXT B.TXT'
+    >>> p._get_arg()
+    ['A.TXT', 'B.TXT']
+
+    See Also
+    --------
+    ArgmntParam
+    '''
+    __slots__ = ()
+
+    @property
+    def value(self):
+        '''The tuple of the values of the parameter.'''
+        return self._value
+
+    @value.setter
+    def value(self, v):
+        if v is not None and v is not False:
+            if isinstance(v, (str, bytes)):
+                v = [v]
+            v = tuple(self._spec.action(i) for i in v)
+        self._value = v
+
+    def __str__(self):
+        '''Return the string of the parameter values.'''
+        return ' '.join(self._get_arg())
+
+    def _get_arg(self):
+        '''Return the parameter as list.'''
+        if self.is_on():
+            return [str(i) for i in self.value]
+        else:
+            return []
+
+    def _paths(self):
+        '''Return the values as the list of paths.'''
+        return self._get_arg()
+
+
 class OptionParam(Param):
     '''Class of option parameter.
 
@@ -321,6 +1410,8 @@ class OptionParam(Param):
         The help or description message for the parameter.
     delimiter : str
         The delimiter to combine the flag and the value of the parameter.
+    io : {None, 'in', 'out'}
+        Declare the value is an input or an output path of the command.
 
     Attributes
     ----------
@@ -331,6 +1422,7 @@ class OptionParam(Param):
     action
     help
     delimiter
+    io
 
     Examples
     --------
@@ -363,8 +1455,11 @@ class OptionParam(Param):
     ArgmntParam
 
     '''
+    __slots__ = ()
+
     def __init__(self, flag, alter=None, name=None, value=None, action=lambda i: i,
-                 help='', delimiter=' '):
+                 help='', delimiter=' ', io=None):
+        self._spec = _Spec()
         self.flag = flag
         self.alter = alter
         self.name = name
@@ -372,18 +1467,23 @@ class OptionParam(Param):
         self.value = value
         self.help = help
         self.delimiter = delimiter
+        self.io = io
+
+    flag = _spec_attr('flag', '''The flag of the parameter.''')
+    alter = _spec_attr('alter', '''The alternative flag of the parameter.''')
+    delimiter = _spec_attr('delimiter', '''The delimiter between the flag and the value.''')
 
     @property
     def name(self):
         '''The name for parameter.'''
-        return self.__name
+        return self._spec.name
 
     @name.setter
     def name(self, s):
         if s is None:
             s = self.convert_flag_to_name(self.flag)
         if s.isidentifier() and not iskeyword(s):
-            self.__name = s
+            self._spec = self._spec._replace(name=s)
         else:
             raise ValueError('Illegal alias name %s.' % s)
 
@@ -396,9 +1496,9 @@ class OptionParam(Param):
     def __repr__(self):
         '''Return the string representation of the option parameter.'''
         # if isinstance(self.value, bool):
-        s = '{}(flag={!r}, alter={!r}, name={!r}, value={!r}, action={}, help={!r}, delimiter={!r})'
+        s = '{}(flag={!r}, alter={!r}, name={!r}, value={!r}, action={}, help={!r}, delimiter={!r}{})'
         return s.format(self.__class__.__name__, self.flag, self.alter, self.name, self.value,
-                        self.action.__name__, self.help, self.delimiter)
+                        self.action.__name__, self.help, self.delimiter, self._io_repr())
 
     def __str__(self):
         if self.is_off():
@@ -435,6 +1535,14 @@ class Parameters(Mapping):
     ordered dictionary is the parameter order given in __init__ and is
     used to order the parameters as in command line.
 
+    The parameters are shared with the copies created by :meth:`copy`,
+    and a parameter is only copied when it is retrieved or changed, so
+    copying this object costs nothing no matter how many parameters it
+    has. Likewise, the command line args of the parameters are rendered
+    once and cached until a value is changed. A mutable value, e.g. a
+    list, is deep copied along with its parameter, so changing it in
+    place never affects the other copies.
+
     Parameters
     ----------
     params : ~collections.abc.Iterable
@@ -486,24 +1594,142 @@ class Parameters(Mapping):
         params : Param list
             a list of parameters.
         '''
-        # create a copy of each param
-        k_v = [(param.name, deepcopy(param)) for param in params]
-        self._data = OrderedDict(k_v)
+        # the shared params, which are never changed
+        self._data = OrderedDict()
+        # the rendered args of the shared params
+        self._args = {}
+        # the params of this object copied from the shared ones on access
+        self._local = {}
+        # the params retrieved by the user, who may change them any time
+        self._exposed = set()
+        # the rendered args list, see `_compile`
+        self._compiled = None
         self._name_map = {}
-        for k in self._data:
-            p = self._data[k]
+        for param in params:
+            if not isinstance(param, Param):
+                raise ValueError('{} is not an instance of `Param`.'.format(param))
+            p = param._copy()
+            self._data[p.name] = p
             if isinstance(p, OptionParam):
                 self._name_map[p.flag] = p.name
                 self._name_map[p.alter] = p.name
-            elif not isinstance(p, Param):
-                raise ValueError('{} is not an instance of `Param`.'.format(p))
 
-    def __iter__(self):
-        '''Iterate over parameter in this object.
+    def copy(self):
+        '''Return a copy of this object.
 
-        Yields
-        ------
-        Param
+        The parameters are not copied until they are retrieved or
+        changed in either object.
+
+        Returns
+        -------
+        Parameters
+
+        Examples
+        --------
+        >>> from dumpling import OptionParam, Parameters
+        >>> p = Parameters(OptionParam('-i'), OptionParam('-o'))
+        >>> q = p.copy()
+        >>> q['i'] = 'input.txt'
+        >>> p['i'].value is None
+        True
+        >>> q['i'].value
+        'input.txt'
+        '''
+        new = object.__new__(self.__class__)
+        if self._local:
+            # the changed params are still owned by this object
+            new._data = OrderedDict((k, self._local[k]._copy() if k in self._local else p)
+                                    for k, p in self._data.items())
+            new._args = {}
+        else:
+            new._data = self._data
+            new._args = self._args
+        new._local = {}
+        new._exposed = set()
+        new._compiled = None
+        new._name_map = self._name_map
+        return new
+
+    def _compile(self):
+        '''Render the args of the params that can not change behind our back.
+
+        Returns
+        -------
+        list
+            The items are either a list of rendered args or a param that
+            has to be rendered every time, i.e. those retrieved by the
+            user and those whose value renders differently on each run.
+        '''
+        segments = []
+        static = []
+        for k, p in self._data.items():
+            if k in self._local:
+                p = self._local[k]
+                dynamic = k in self._exposed or isinstance(p.value, PipeInput)
+            else:
+                dynamic = isinstance(p.value, PipeInput)
+            if dynamic:
+                if static:
+                    segments.append(static)
+                    static = []
+                segments.append(p)
+            elif k in self._local:
+                static.extend(p._get_arg())
+            else:
+                try:
+                    static.extend(self._args[k])
+                except KeyError:
+                    args = self._args[k] = p._get_arg()
+                    static.extend(args)
+        if static:
+            segments.append(static)
+        return segments
+
+    def _argv(self):
+        '''Return the command line args of the parameters.'''
+        if self._compiled is None:
+            self._compiled = self._compile()
+        argv = []
+        for segment in self._compiled:
+            if isinstance(segment, list):
+                argv.extend(segment)
+            else:
+                argv.extend(segment._get_arg())
+        return argv
+
+    def _name(self, key):
+        '''Return the name of the parameter by its name or flag.'''
+        if key in self._data:
+            return key
+        elif key in self._name_map:
+            return self._name_map[key]
+        else:
+            raise KeyError(key)
+
+    def _get(self, name):
+        '''Return the current param without copying or exposing it.'''
+        return self._local.get(name, self._data[name])
+
+    def _own(self, name):
+        '''Return the param of this object, copying the shared one if needed.'''
+        try:
+            return self._local[name]
+        except KeyError:
+            p = self._local[name] = self._data[name]._copy()
+            return p
+
+    def _values(self):
+        '''Yield the current params in order without copying them.'''
+        local = self._local
+        for k, p in self._data.items():
+            yield local.get(k, p)
+
+    def __iter__(self):
+        '''Iterate over parameter in this object.
+
+        Yields
+        ------
+        Param
             Child class of :class:`.Param`
         '''
         return iter(self._data)
@@ -518,93 +1744,1489 @@ class Parameters(Mapping):
         Parameters
         ----------
         key : str
-            The flag or name of a parameter
+            The flag or name of a parameter
+        '''
+        return key in self._data or key in self._name_map
+
+    def __getitem__(self, key):
+        '''Return the :class:`.Param` child class object by key.
+
+        Parameters
+        ----------
+        key : str
+            The name or flag of the parameter to be retrieved.
+        '''
+        name = self._name(key)
+        if name not in self._exposed:
+            # the caller may change the param, so stop caching its args
+            self._exposed.add(name)
+            self._compiled = None
+        return self._own(name)
+
+    def __setitem__(self, k, v):
+        '''Set the value of specified paramter.
+
+        Parameters
+        ----------
+        k : str
+            The name or flag of a parameter.
+        v : arbitrary object
+            The new value of the parameter.
+
+        Raises
+        ------
+        ValueError
+            If the key is not in this :class:`.Parameters` object.
+        '''
+        if k in self:
+            self._own(self._name(k)).on(v)
+            self._compiled = None
+        else:
+            msg = 'You cannot set value {!r} on unknown key {!r}'
+            raise ValueError(msg.format(v, k))
+
+    def update(self, **kwargs):
+        '''Update the parameter values.
+
+        Parameters
+        ----------
+        kwargs : dict
+            keyword arguments. The key and value to update the parameters
+            in this :class:`.Parameters` object.
+
+        Notes
+        -----
+        If multiple keys of the same parameter are given, the flag key will
+        be overwritten by the name key. See the examples.
+
+        Examples
+        --------
+        >>> from dumpling import OptionParam, Parameters
+        >>> p = Parameters(*[OptionParam('--threads', name='cpus'), OptionParam('-i')])
+        >>> p
+        OptionParam(flag='--threads', alter=None, name='cpus', value=None, action=<lambda>, help='', delimiter=' ')
+        OptionParam(flag='-i', alter=None, name='i', value=None, action=<lambda>, help='', delimiter=' ')
+        >>> p.update(cpus=2, **{'--threads': 1})
+        >>> p   # '--threads' is overridden by 'cpus'
+        OptionParam(flag='--threads', alter=None, name='cpus', value=2, action=<lambda>, help='', delimiter=' ')
+        OptionParam(flag='-i', alter=None, name='i', value=None, action=<lambda>, help='', delimiter=' ')
+        >>> p.update(**{'cpus': 3, '--threads': 1})
+        >>> p
+        OptionParam(flag='--threads', alter=None, name='cpus', value=3, action=<lambda>, help='', delimiter=' ')
+        OptionParam(flag='-i', alter=None, name='i', value=None, action=<lambda>, help='', delimiter=' ')
+        '''
+        for k in sorted(kwargs):
+            self[k] = kwargs[k]
+
+    def off(self):
+        '''Turn off all the parameters.'''
+        for k, p in self._data.items():
+            if k in self._local or p.value is not None:
+                self._own(k).off()
+        self._compiled = None
+
+    def sweep(self, **axes):
+        '''Return the args lists for all the combinations of the given values.
+
+        Each value is validated and rendered only once before the
+        iteration starts, and the args lists are then assembled lazily
+        from the rendered pieces, so no object is created per combination
+        other than the list itself.
+
+        Parameters
+        ----------
+        axes : dict
+            The key is the name or flag of a parameter and the value is the
+            iterable of values for the parameter. The other parameters keep
+            their current values.
+
+        Returns
+        -------
+        ~collections.abc.Iterator of list of str
+            The args lists of the Cartesian product of the values. The
+            values of the last axis change the fastest.
+
+        Raises
+        ------
+        ValueError
+            If a key is unknown or given twice, or a value is illegal.
+
+        Examples
+        --------
+        >>> from dumpling import OptionParam, Parameters, check_range
+        >>> p = Parameters(OptionParam('-E', action=check_range(0, 1)),
+        ...                OptionParam('--cpu', value=1),
+        ...                OptionParam('--nohmm'))
+        >>> for args in p.sweep(E=[1e-5, 0.1], nohmm=[False, True]):
+        ...     print(args)
+        ['-E', '1e-05', '--cpu', '1']
+        ['-E', '1e-05', '--cpu', '1', '--nohmm']
+        ['-E', '0.1', '--cpu', '1']
+        ['-E', '0.1', '--cpu', '1', '--nohmm']
+        >>> p.sweep(E=[0.5, 2])
+        Traceback (most recent call last):
+         ...
+        ValueError: Illegal value: 2
+        '''
+        rendered = OrderedDict()
+        for k, values in axes.items():
+            if k not in self:
+                raise ValueError('You cannot sweep on unknown key {!r}'.format(k))
+            name = self._name(k)
+            if name in rendered:
+                raise ValueError('Multiple axes are given for parameter {!r}'.format(name))
+            p = self._local.get(name, self._data[name])._copy()
+            rendered[name] = [p.on(v)._get_arg() for v in values]
+        # static args lists interleaved with the indices of the axes
+        index = {k: i for i, k in enumerate(rendered)}
+        segments = []
+        static = []
+        for k, p in zip(self._data, self._values()):
+            if k in index:
+                if static:
+                    segments.append(static)
+                    static = []
+                segments.append(index[k])
+            else:
+                static.extend(p._get_arg())
+        if static:
+            segments.append(static)
+
+        def generate():
+            for combination in product(*rendered.values()):
+                argv = []
+                for segment in segments:
+                    if isinstance(segment, list):
+                        argv.extend(segment)
+                    else:
+                        argv.extend(combination[segment])
+                yield argv
+        return generate()
+
+    def paths(self, io):
+        '''Return the paths given to the parameters declared as input or output.
+
+        Parameters
+        ----------
+        io : {'in', 'out'}
+            Return the input or output paths.
+
+        Returns
+        -------
+        list of str
+            The values of the parameters that are on and declared with `io`.
+
+        Examples
+        --------
+        >>> from dumpling import ArgmntParam, OptionParam, Parameters
+        >>> p = Parameters(OptionParam('-o', value='hits.txt', io='out'),
+        ...                OptionParam('-q', io='in'),
+        ...                ArgmntParam('db', 'Rfam.cm', io='in'))
+        >>> p.paths('in')
+        ['Rfam.cm']
+        >>> p.paths('out')
+        ['hits.txt']
+        '''
+        return [i for p in self._values()
+                if p.io == io and p.is_on() for i in p._paths()]
+
+    def __repr__(self):
+        '''String representation of the :class:`.Parameters` object.'''
+        items = []
+        for p in self._values():
+            items.append(repr(p))
+        return '\n'.join(items)
+
+
+class PipeInput:
+    '''In-memory data given to a parameter expecting an input file path.
+
+    Use it as the value of :class:`.ArgmntParam` or :class:`.OptionParam`
+    for the tools that only read input from a path. When the app runs, a
+    pipe is created and its read end is passed to the command as the path
+    ``/dev/fd/N``, while the data is written into the pipe from a thread,
+    so no temp file is written to disk. The data is consumed by the run,
+    so a new object is needed for each run.
+
+    Parameters
+    ----------
+    data : bytes, str, file-like object, or ~collections.abc.Iterable of bytes or str
+        The data to pass to the command.
+
+    Attributes
+    ----------
+    data
+    fd
+
+    Examples
+    --------
+    >>> from dumpling import ArgmntParam, Parameters, PipeInput, dumpling_factory
+    >>> Cat = dumpling_factory('cat', 'cat', Parameters(ArgmntParam('file')))
+    >>> app = Cat()
+    >>> app.update(file=PipeInput(('>seq{}\\nACGU\\n'.format(i) for i in range(2))))
+    >>> print(app().stdout, end='')
+    >seq0
+    ACGU
+    >seq1
+    ACGU
+    '''
+    def __init__(self, data):
+        self.data = data
+        self.fd = None
+        self._wfd = None
+
+    def __str__(self):
+        '''Return the path passed to the command.'''
+        return '/dev/fd/{}'.format('N' if self.fd is None else self.fd)
+
+    def __repr__(self):
+        return '{}(fd={!r})'.format(self.__class__.__name__, self.fd)
+
+    def _open(self):
+        '''Create the pipe before the command is rendered.'''
+        self.fd, self._wfd = os.pipe()
+        return self
+
+    def _start(self):
+        '''Start writing data after the command is spawned.'''
+        os.close(self.fd)
+        return _Worker(_feed, open(self._wfd, 'wb'), self.data)
+
+    def _close(self):
+        '''Close the pipe if the command fails to spawn.'''
+        os.close(self.fd)
+        os.close(self._wfd)
+
+
+def _replayable(data):
+    '''Return True if the input data can be fed again.'''
+    return data is None or isinstance(data, (bytes, str))
+
+
+def _pipe_inputs(params):
+    '''Return the :class:`.PipeInput` values of the parameters.'''
+    return [p.value for p in params._values() if isinstance(p.value, PipeInput)]
+
+
+class BatchRunner:
+    '''Run an app with many sets of parameters concurrently.
+
+    The commands are run in a pool of threads; each thread just waits on
+    its child process, so the number of workers is the number of
+    commands running at the same time. All the :meth:`map` calls on the
+    same runner share the pool and thus the concurrency cap.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        The maximal number of commands running at the same time. Default is
+        the number of CPUs.
+
+    Examples
+    --------
+    >>> from dumpling import ArgmntParam, Parameters, BatchRunner, dumpling_factory
+    >>> Echo = dumpling_factory('echo', 'echo', Parameters(ArgmntParam('msg')))
+    >>> with BatchRunner(max_workers=2) as runner:
+    ...     for proc in runner.map(Echo(), [{'msg': 'a'}, {'msg': 'b'}, {'msg': 'c'}]):
+    ...         print(proc.stdout, end='')
+    a
+    b
+    c
+    '''
+    def __init__(self, max_workers=None):
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def shutdown(self, wait=True):
+        '''Release the worker threads.'''
+        self._executor.shutdown(wait=wait)
+
+    def submit(self, app, kwargs, journal=None, **call_kwargs):
+        '''Schedule one run of the app with the updated parameters.
+
+        Parameters
+        ----------
+        app : Dumpling
+            The app controller. It is copied so that it is not modified.
+        kwargs : dict
+            The parameter values to update the copy of the app with.
+        journal : BatchJournal, optional
+            The journal to record the run in. The run is skipped if the
+            journal has it done.
+        call_kwargs : keyword arguments
+            Passed to the call of the app.
+
+        Returns
+        -------
+        concurrent.futures.Future
+        '''
+        job = app.copy()
+        job.update(**kwargs)
+        if journal is not None:
+            job = self._journaled(job, journal, call_kwargs)
+            if isinstance(job, Future):
+                return job
+        return self._executor.submit(job, **call_kwargs)
+
+    @staticmethod
+    def _journaled(job, journal, call_kwargs):
+        '''Return the job recording its run, or the future of its result if it is done.'''
+        run = journal.wrap(job, call_kwargs.get('stdin'), call_kwargs.get('input'),
+                           call_kwargs.get('cwd'))
+        if run is not None:
+            return run
+        future = Future()
+        proc = CompletedProcess(job.command, 0)
+        proc.usage = None
+        future.set_result(proc)
+        return future
+
+    def map(self, app, kwargs_list, ordered=True, journal=None, **call_kwargs):
+        '''Run the app for each set of parameters.
+
+        Parameters
+        ----------
+        app : Dumpling
+            The app controller to run.
+        kwargs_list : ~collections.abc.Iterable of dict
+            The parameter values for each run. It is consumed lazily, so it
+            can be a generator of many items.
+        ordered : bool
+            Yield the results in the input order if `True` (default);
+            otherwise yield them as they finish.
+        journal : BatchJournal, optional
+            The journal to record the runs in, to resume the batch if it
+            is interrupted.
+        call_kwargs : keyword arguments
+            Passed to the call of the app, e.g. ``check=False``.
+
+        Yields
+        ------
+        `subprocess.CompletedProcess`
+            The result of each run. An exception raised by a run is
+            re-raised when its result is yielded. The run skipped because
+            it is done in the `journal` has no output and its `usage` is
+            `None`.
+        '''
+        jobs = (self.submit(app, kwargs, journal=journal, **call_kwargs) for kwargs in kwargs_list)
+        # keep a bounded number of jobs queued ahead of the workers
+        window = 2 * self.max_workers
+        pending = deque(islice(jobs, window))
+        try:
+            while pending:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                pending.extend(islice(jobs, len(done)))
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class SlotScheduler(BatchRunner):
+    '''Run apps concurrently within a budget of CPUs and memory.
+
+    Each job occupies as many CPU slots as the number of threads its app
+    uses (see the `threads` argument of :func:`.dumpling_factory`), and
+    optionally an amount of memory. The queued jobs are started in order
+    as soon as they fit into the free slots and memory; a job that does not
+    fit lets the smaller ones behind it start first, so the CPUs are
+    never oversubscribed nor left idle while a job fits. Once the first
+    waiting job has been passed over `max_skips` times, the freed
+    resources are reserved for it so that it is not starved by a stream
+    of smaller jobs.
+
+    Parameters
+    ----------
+    slots : int, optional
+        The number of CPU slots. Default is the number of CPUs.
+    memory : int, optional
+        The memory budget, in any unit consistent with the memory of the
+        jobs. Default is unlimited.
+    max_skips : int, optional
+        The number of jobs that may start ahead of the first waiting job.
+        Default is the number of slots; 0 starts the jobs strictly in
+        order.
+
+    Examples
+    --------
+    >>> from dumpling import ArgmntParam, OptionParam, Parameters, SlotScheduler, dumpling_factory
+    >>> params = Parameters(OptionParam('--cpu', value=1), ArgmntParam('query'))
+    >>> Echo = dumpling_factory('echo', ['sh', '-c', 'echo $3 $2', 'echo'], params, threads='--cpu')
+    >>> app = Echo()
+    >>> app.cpus()
+    1
+    >>> with SlotScheduler(slots=4) as scheduler:
+    ...     procs = scheduler.map(app, [{'query': 'a.fa', 'cpu': 4}, {'query': 'b.fa'}])
+    ...     for proc in procs:
+    ...         print(proc.stdout, end='')
+    a.fa 4
+    b.fa 1
+    '''
+    def __init__(self, slots=None, memory=None, max_skips=None):
+        super().__init__(slots)
+        self.slots = self.max_workers
+        self.memory = memory
+        self.max_skips = self.slots if max_skips is None else max_skips
+        # the first waiting job and the number of jobs started ahead of it
+        self._head = None
+        self._skips = 0
+        self._free_slots = self.slots
+        self._free_memory = memory
+        self._pending = deque()
+        self._running = 0
+        self._changed = threading.Condition()
+
+    def submit(self, app, kwargs, memory=0, journal=None, **call_kwargs):
+        '''Queue one run of the app with the updated parameters.
+
+        Parameters
+        ----------
+        app : Dumpling
+            The app controller. It is copied so that it is not modified.
+        kwargs : dict
+            The parameter values to update the copy of the app with.
+        memory : int
+            The memory the run needs.
+        journal : BatchJournal, optional
+            The journal to record the run in. The run is skipped if the
+            journal has it done.
+        call_kwargs : keyword arguments
+            Passed to the call of the app.
+
+        Returns
+        -------
+        concurrent.futures.Future
+        '''
+        job = app.copy()
+        job.update(**kwargs)
+        # a job larger than the whole budget runs alone
+        slots = min(job.cpus(), self.slots)
+        if journal is not None:
+            job = self._journaled(job, journal, call_kwargs)
+            if isinstance(job, Future):
+                return job
+        if self.memory is not None:
+            memory = min(memory, self.memory)
+        future = Future()
+        with self._changed:
+            self._pending.append((slots, memory, job, call_kwargs, future))
+            self._dispatch()
+        return future
+
+    def _fits(self, slots, memory):
+        '''Return True if the resources are free.'''
+        return slots <= self._free_slots and (self.memory is None or memory <= self._free_memory)
+
+    def _dispatch(self):
+        '''Start the queued jobs that fit. It is called with the lock held.'''
+        blocked = False
+        for item in list(self._pending):
+            if self._free_slots == 0:
+                break
+            slots, memory, _, _, future = item
+            if future.cancelled():
+                self._pending.remove(item)
+            elif self._fits(slots, memory):
+                if blocked:
+                    if self._skips >= self.max_skips:
+                        # reserve the free resources for the first waiting job
+                        break
+                    self._skips += 1
+                self._pending.remove(item)
+                self._free_slots -= slots
+                if self.memory is not None:
+                    self._free_memory -= memory
+                self._running += 1
+                self._executor.submit(self._run, item)
+            elif not blocked:
+                blocked = True
+                if future is not self._head:
+                    self._head = future
+                    self._skips = 0
+        self._changed.notify_all()
+
+    def _run(self, item):
+        '''Run a job and release its resources.'''
+        slots, memory, job, call_kwargs, future = item
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(job(**call_kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            with self._changed:
+                self._free_slots += slots
+                if self.memory is not None:
+                    self._free_memory += memory
+                self._running -= 1
+                self._dispatch()
+
+    def shutdown(self, wait=True):
+        '''Wait for all the queued jobs and release the worker threads.
+
+        If `wait` is `False`, the queued jobs that have not started are
+        cancelled.'''
+        with self._changed:
+            if wait:
+                self._changed.wait_for(lambda: not self._pending and not self._running)
+            else:
+                for item in self._pending:
+                    item[-1].cancel()
+                self._pending.clear()
+        super().shutdown(wait)
+
+
+class BatchJournal:
+    '''Crash-safe journal of the completed runs of a batch.
+
+    Each finished run appends a JSON line of its command args list, the
+    fingerprint of its input, its status (``'done'`` if it exited with 0,
+    ``'failed'`` otherwise, or ``'error'`` if it raised) and its return
+    code. The line is flushed and synced to the disk before the run is
+    reported, so the journal survives the batch being killed. Pass it to
+    :meth:`BatchRunner.map` and rerun the batch with the same journal to
+    skip the runs already done.
+
+    The input fingerprint is the path, size and modification time of the
+    files of the parameters declared with ``io='in'`` (relative to the
+    working dir of the run) and of the stdin given as a file path, plus
+    the sha256 digest of the `input` data, so a run is repeated if its
+    input files have changed. The runs fed from an iterator, a file object
+    or a :class:`.PipeInput`, or with a missing input file, can not be
+    fingerprinted and are always run.
+
+    Parameters
+    ----------
+    path : str
+        The file to append the records to. The records already in it are
+        loaded, ignoring a last line truncated by a crash.
+
+    Examples
+    --------
+    >>> from tempfile import mkdtemp
+    >>> from shutil import rmtree
+    >>> from os.path import join
+    >>> from dumpling import ArgmntParam, Parameters, BatchRunner, BatchJournal, dumpling_factory
+    >>> Echo = dumpling_factory('echo', 'echo', Parameters(ArgmntParam('msg')))
+    >>> tmpd = mkdtemp()
+    >>> path = join(tmpd, 'batch.jsonl')
+    >>> with BatchRunner() as runner, BatchJournal(path) as journal:
+    ...     procs = list(runner.map(Echo(), [{'msg': 'a'}, {'msg': 'b'}], journal=journal))
+    >>> with BatchRunner() as runner, BatchJournal(path) as journal:
+    ...     for proc in runner.map(Echo(), [{'msg': 'a'}, {'msg': 'c'}], journal=journal):
+    ...         print(proc.args, proc.stdout)
+    ['echo', 'a'] None
+    ['echo', 'c'] c
+    <BLANKLINE>
+    >>> len(BatchJournal(path))
+    3
+    >>> rmtree(tmpd)
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done = set()
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('status') == 'done':
+                self._done.add(record['key'])
+        self._file = open(path, 'a')
+        if data and not data.endswith(b'\n'):
+            # end the line truncated by a crash
+            self._file.write('\n')
+
+    def __len__(self):
+        '''Return the number of runs done.'''
+        return len(self._done)
+
+    def __contains__(self, key):
+        '''Return True if the run of the key is done.'''
+        return key in self._done
+
+    def fingerprint(self, app, stdin=None, input=None, cwd=None):
+        '''Return the fingerprint of the input of a run of the app.
+
+        Parameters
+        ----------
+        app : Dumpling
+            The app controller to run.
+        stdin : arbitrary
+            The stdin passed to the run.
+        input : arbitrary
+            The input passed to the run.
+        cwd : str, optional
+            The working dir of the run. The relative input paths are
+            resolved against it.
+
+        Returns
+        -------
+        list or None
+            `None` if the input can not be fingerprinted.
+        '''
+        if not (stdin is None or stdin is PIPE or isinstance(stdin, str)):
+            return None
+        if not _replayable(input) or _pipe_inputs(app.params):
+            return None
+        paths = [os.path.join(cwd or '', i) for i in app.params.paths('in')]
+        if isinstance(stdin, str):
+            # the stdin is opened in the current dir
+            paths.append(stdin)
+        files = []
+        try:
+            for path in paths:
+                st = os.stat(path)
+                files.append([os.path.realpath(path), st.st_size, st.st_mtime_ns])
+        except OSError:
+            return None
+        if isinstance(input, str):
+            input = input.encode()
+        return [files, None if input is None else sha256(input).hexdigest()]
+
+    def key(self, app, stdin=None, input=None, cwd=None):
+        '''Return the key identifying a run of the app, or `None`.
+
+        See :meth:`fingerprint` for the parameters.
+        '''
+        fingerprint = self.fingerprint(app, stdin, input, cwd)
+        if fingerprint is None:
+            return None
+        data = [app.version, app.command, os.path.abspath(cwd or os.curdir), fingerprint]
+        return sha256(json.dumps(data).encode()).hexdigest()
+
+    def record(self, key, args, returncode=None):
+        '''Append the record of a finished run and sync it to the disk.
+
+        Parameters
+        ----------
+        key : str
+            The key of the run.
+        args : list of str
+            The command args list of the run.
+        returncode : int, optional
+            The return code of the run, or `None` if it raised.
+        '''
+        if returncode is None:
+            status = 'error'
+        else:
+            status = 'done' if returncode == 0 else 'failed'
+        record = {'key': key, 'args': args, 'status': status,
+                  'returncode': returncode, 'time': time.time()}
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if status == 'done':
+                self._done.add(key)
+
+    def wrap(self, job, stdin=None, input=None, cwd=None):
+        '''Return the job recording its run, or `None` if it is done.
+
+        Parameters
+        ----------
+        job : Dumpling
+            The app controller to run.
+        stdin, input, cwd : arbitrary
+            The stdin, input and working dir passed to the run.
+
+        Returns
+        -------
+        callable or None
+            It calls the job with the same arguments and records the result.
+        '''
+        key = self.key(job, stdin, input, cwd)
+        if key is None:
+            return job
+        if key in self:
+            return None
+
+        def run(**call_kwargs):
+            try:
+                proc = job(**call_kwargs)
+            except CalledProcessError as e:
+                self.record(key, job.command, e.returncode)
+                raise
+            except BaseException:
+                self.record(key, job.command)
+                raise
+            self.record(key, job.command, proc.returncode)
+            return proc
+        return run
+
+    def close(self):
+        '''Close the file.'''
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ProcessStream:
+    '''Iterate over the stdout of a running command as it is produced.
+
+    The stdout is read incrementally so the memory use is bounded no
+    matter how much the command outputs. The stderr is drained in a
+    background thread so that the child never blocks on a full stderr
+    pipe. Use it as a context manager to make sure the child is reaped.
+
+    Parameters
+    ----------
+    args : list of str
+        The command args list.
+    cwd : str
+        working dir
+    stdin, stderr : None, str, `subprocess.DEVNULL`, or `subprocess.PIPE` (default)
+        The stdin and stderr of the command. The stderr collected with
+        `subprocess.PIPE` is available as :attr:`stderr` after the command
+        finishes.
+    check : bool
+        Raise `subprocess.CalledProcessError` at the end of the iteration if
+        the command exits with non-zero code.
+    text : bool
+        Yield str if `True` (default); otherwise yield bytes.
+    chunk_size : int, optional
+        Yield chunks of at most this size instead of lines.
+    input : bytes, str, file-like object, or ~collections.abc.Iterable of bytes or str, optional
+        The data fed into the stdin from a thread.
+    pipes : list of PipeInput
+        The opened :class:`.PipeInput` objects in the args.
+
+    Attributes
+    ----------
+    args
+    returncode
+    stderr
+
+    Examples
+    --------
+    >>> from dumpling import ProcessStream
+    >>> with ProcessStream(['printf', 'a\\nb\\n']) as lines:
+    ...     for line in lines:
+    ...         print(line, end='')
+    a
+    b
+    >>> lines.returncode
+    0
+    '''
+    def __init__(self, args, cwd=None, stdin=PIPE, stderr=PIPE, check=True,
+                 text=True, chunk_size=None, input=None, pipes=()):
+        if input is not None and stdin is not PIPE:
+            raise ValueError('stdin and input arguments may not both be used.')
+        self.args = args
+        self.check = check
+        self.chunk_size = chunk_size
+        self.returncode = None
+        self.stderr = None
+        self._finished = False
+        try:
+            with _std_files(stdin, None, stderr) as (stdin, _, stderr):
+                self._proc = Popen(args, executable=_resolve(args[0]), cwd=cwd, stdin=stdin,
+                                   stdout=PIPE, stderr=stderr, pass_fds=[p.fd for p in pipes])
+        except BaseException:
+            for p in pipes:
+                p._close()
+            raise
+        self._workers = [p._start() for p in pipes]
+        if self._proc.stdin is not None:
+            self._workers.append(_Worker(_feed, self._proc.stdin, input))
+        self._stdout = self._proc.stdout
+        if text:
+            self._stdout = io.TextIOWrapper(self._stdout, locale.getpreferredencoding(False))
+        self._drainer = None
+        if self._proc.stderr is not None:
+            self._drainer = _Worker(_read, self._proc.stderr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self._finished:
+            # stop the command if the stream is abandoned half way
+            self._proc.terminate()
+            self._finish(check=False)
+
+    def __iter__(self):
+        '''Yield the lines or chunks of the stdout.'''
+        stdout = self._stdout
+        if self.chunk_size is None:
+            yield from stdout
+        else:
+            read = getattr(stdout, 'read1', stdout.read)
+            while True:
+                chunk = read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        self._finish(self.check)
+
+    def _finish(self, check):
+        '''Reap the child and collect its stderr.'''
+        self._finished = True
+        self._stdout.close()
+        self.returncode = self._proc.wait()
+        for w in self._workers:
+            w.join()
+        if self._drainer is not None:
+            self.stderr = self._drainer.get()
+            if isinstance(self._stdout, io.TextIOWrapper):
+                self.stderr = _decode(self.stderr)
+        if check and self.returncode:
+            raise CalledProcessError(self.returncode, self.args, stderr=self.stderr)
+
+
+class Pipeline:
+    '''Chain of apps with each stdout connected to the next stdin.
+
+    The stages are connected with OS pipes and run at the same time, so
+    no intermediate output is written to disk. It is usually created with
+    the ``|`` operator on the app controllers.
+
+    Parameters
+    ----------
+    apps : Dumpling
+        The app controllers of the stages in order.
+
+    Attributes
+    ----------
+    apps
+    command
+
+    Examples
+    --------
+    >>> from dumpling import ArgmntParam, OptionParam, Parameters, dumpling_factory
+    >>> Seq = dumpling_factory('seq', 'seq', Parameters(ArgmntParam('last')))
+    >>> Sort = dumpling_factory('sort', 'sort', Parameters(OptionParam('-n'), OptionParam('-r')))
+    >>> seq, sort = Seq(), Sort()
+    >>> seq.update(last=3)
+    >>> sort.update(n=True, r=True)
+    >>> pipeline = seq | sort
+    >>> print(pipeline)
+    seq 3 | sort -n -r
+    >>> proc = pipeline()
+    >>> print(proc.stdout, end='')
+    3
+    2
+    1
+    >>> [stage.returncode for stage in proc.stages]
+    [0, 0]
+    '''
+    def __init__(self, *apps):
+        self.apps = list(apps)
+
+    def __or__(self, other):
+        if isinstance(other, Pipeline):
+            return Pipeline(*self.apps, *other.apps)
+        return Pipeline(*self.apps, other)
+
+    @property
+    def command(self):
+        '''The command args lists of the stages.'''
+        return [app.command for app in self.apps]
+
+    def __str__(self):
+        '''Return the command run.'''
+        return ' | '.join(str(app) for app in self.apps)
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, ', '.join(
+            app.__class__.__name__ for app in self.apps))
+
+    def __call__(self, cwd=None, stdin=PIPE, stdout=PIPE, stderr=PIPE, check=True, input=None):
+        '''Run all the stages.
+
+        Parameters
+        ----------
+        cwd : str
+            working dir
+        stdin : None, str, `subprocess.DEVNULL`, or `subprocess.PIPE` (default)
+            The stdin of the first stage.
+        stdout : None, str, `subprocess.DEVNULL`, or `subprocess.PIPE` (default)
+            The stdout of the last stage.
+        stderr : None, str, `subprocess.DEVNULL`, or `subprocess.PIPE` (default)
+            The stderr of all the stages. With `subprocess.PIPE`, the
+            stderr of each stage is collected separately.
+        check : bool
+            Raise `subprocess.CalledProcessError` if any stage exits with
+            non-zero code.
+        input : bytes, str, file-like object, or ~collections.abc.Iterable of bytes or str, optional
+            The data fed into the stdin of the first stage.
+
+        Returns
+        -------
+        `subprocess.CompletedProcess`
+            Its `args` is the list of the stage commands and its `stdout`
+            is the output of the last stage. Like ``set -o pipefail`` in
+            bash, its `returncode` is that of the last stage exiting with
+            non-zero code, or zero. Its `stderr` is the concatenated stderr
+            of the stages. Its extra attribute `stages` is the list of
+            `subprocess.CompletedProcess` of each stage, holding its own
+            `returncode` and `stderr`.
+        '''
+        if input is not None and stdin is not PIPE:
+            raise ValueError('stdin and input arguments may not both be used.')
+        procs = []
+        workers = []
+        with _std_files(stdin, stdout, stderr) as (stdin, stdout, stderr):
+            try:
+                for i, app in enumerate(self.apps):
+                    last = i == len(self.apps) - 1
+                    pipes = app._open_pipes()
+                    try:
+                        args = app.command
+                        proc = Popen(args, executable=_resolve(args[0]), cwd=cwd,
+                                     stdin=procs[-1].stdout if procs else stdin,
+                                     stdout=stdout if last else PIPE, stderr=stderr,
+                                     pass_fds=[p.fd for p in pipes])
+                    except BaseException:
+                        for p in pipes:
+                            p._close()
+                        raise
+                    workers.extend(p._start() for p in pipes)
+                    if procs:
+                        # only the child holds the read end, so that the
+                        # upstream gets SIGPIPE if it exits early
+                        procs[-1].stdout.close()
+                    procs.append(proc)
+                if procs[0].stdin is not None:
+                    workers.append(_Worker(_feed, procs[0].stdin, input))
+                errs = [None if p.stderr is None else _Worker(_read, p.stderr) for p in procs]
+                out = None if procs[-1].stdout is None else _read(procs[-1].stdout)
+                errs = [None if e is None else _decode(e.get()) for e in errs]
+                for w in workers:
+                    w.get()
+                for p in procs:
+                    p.wait()
+            except BaseException:
+                for p in procs:
+                    p.kill()
+                    p.wait()
+                raise
+        command = [p.args for p in procs]
+        stages = [CompletedProcess(p.args, p.returncode, None, e) for p, e in zip(procs, errs)]
+        returncode = 0
+        for p in procs:
+            if p.returncode:
+                returncode = p.returncode
+        err = None
+        if stderr is PIPE:
+            err = ''.join(errs)
+        proc = CompletedProcess(command, returncode, _decode(out), err)
+        proc.stages = stages
+        if check:
+            proc.check_returncode()
+        return proc
+
+
+def _digest(path):
+    '''Return the sha256 hex digest of the content of a file or directory.'''
+    h = sha256()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for f in sorted(files):
+                fp = os.path.join(root, f)
+                h.update(os.path.relpath(fp, path).encode())
+                h.update(_digest(fp).encode())
+    else:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()
+
+
+def _up_to_date(inputs, outputs, cwd=None):
+    '''Return True if all the outputs exist and none is older than any input.
+
+    Like make, it returns False if there is no output at all.'''
+    if not outputs:
+        return False
+    try:
+        oldest = min(os.path.getmtime(os.path.join(cwd or '', o)) for o in outputs)
+        newest = max((os.path.getmtime(os.path.join(cwd or '', i)) for i in inputs),
+                     default=oldest)
+    except OSError:
+        return False
+    return newest <= oldest
+
+
+def _copy(src, dst):
+    '''Copy a file or a directory.'''
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, dirs_exist_ok=True)
+    else:
+        shutil.copyfile(src, dst)
+
+
+def _size(path):
+    '''Return the total size of the files in a directory.'''
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            total += os.path.getsize(os.path.join(root, f))
+    return total
+
+
+def _shard_offsets(data, n, record=None):
+    '''Return the offsets splitting the data into at most n shards of whole records.
+
+    Each record starts with the `record` prefix at the beginning of a
+    line, or is a single line if `record` is None. The shards are of
+    roughly equal size and the data is only scanned around the split
+    points.
+
+    Examples
+    --------
+    >>> _shard_offsets(b'>a\\nAC\\n>b\\nGT\\n>c\\nTT\\n', 2, b'>')
+    [0, 12, 18]
+    >>> _shard_offsets(b'1\\n2\\n3\\n', 5)
+    [0, 2, 4, 6]
+    '''
+    sep = b'\n' if record is None else b'\n' + record
+    size = len(data)
+    offsets = [0]
+    for i in range(1, n):
+        start = max(size * i // n, offsets[-1])
+        j = data.find(sep, max(start - 1, 0))
+        if j == -1 or j + 1 >= size:
+            break
+        if j + 1 > offsets[-1]:
+            offsets.append(j + 1)
+    offsets.append(size)
+    return offsets
+
+
+def _split(path, n, directory, record=None):
+    '''Split the file into at most n shard files of whole records.
+
+    The file is memory mapped, so it is neither parsed nor loaded in
+    memory as a whole. If `record` is None, it is ``'>'`` (FASTA) if the
+    file starts with it, otherwise each line is a record.
+
+    Returns
+    -------
+    list of str
+        The paths of the shard files in the directory.
+    '''
+    if isinstance(record, str):
+        record = record.encode()
+    paths = []
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            data = b''
+        else:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with memoryview(data) as view:
+            if record is None:
+                record = b'>' if data[:1] == b'>' else None
+            offsets = _shard_offsets(data, n, record)
+            for i, (start, end) in enumerate(zip(offsets, offsets[1:])):
+                paths.append(os.path.join(directory, '{}.{}'.format(i, os.path.basename(path))))
+                with open(paths[-1], 'wb') as out:
+                    out.write(view[start:end])
+        if isinstance(data, mmap.mmap):
+            data.close()
+    return paths
+
+
+def _arg_max():
+    '''Return the bytes available to the args list of a command.
+
+    It is the system limit less the environment and some headroom,
+    like xargs does.'''
+    try:
+        limit = os.sysconf('SC_ARG_MAX')
+    except (AttributeError, ValueError, OSError):
+        limit = 2 ** 17
+    env = sum(_arg_size(k) + _arg_size(v) for k, v in os.environ.items())
+    return limit - env - 2048
+
+
+def _arg_size(arg):
+    '''Return the bytes an arg takes in the args list, with its pointer.'''
+    return len(os.fsencode(arg)) + 1 + (sys.maxsize.bit_length() + 1) // 8
+
+
+def _batches(base, items, limit, max_args):
+    '''Split the items into batches fitting into the limit along with the base args.
+
+    Examples
+    --------
+    >>> _batches(['ls'], ['a', 'b', 'c'], 100, 2)
+    [['a', 'b'], ['c']]
+    >>> _batches(['ls'], ['a', 'b', 'c'], 40, 10)
+    [['a', 'b'], ['c']]
+    '''
+    base_size = sum(_arg_size(a) for a in base)
+    batches = []
+    batch, size = [], base_size
+    for item in items:
+        cost = _arg_size(str(item))
+        if batch and (size + cost > limit or len(batch) >= max_args):
+            batches.append(batch)
+            batch, size = [], base_size
+        batch.append(item)
+        size += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _concat(paths, dst):
+    '''Concatenate the files into the destination file.'''
+    with open(dst, 'wb') as out:
+        for path in paths:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, out)
+
+
+class ResultCache:
+    '''On-disk cache of the results of app runs.
+
+    A run is identified by its command args list, the app version, and the
+    absolute paths and content of the files given to the parameters
+    declared with ``io='in'`` (and of the stdin if it is given as a file
+    path), resolved against the working dir of the run. A
+    successful run stores its captured stdout and stderr and copies of
+    its output files, i.e. the paths of the parameters declared with
+    ``io='out'`` and the stdout or stderr given as file paths. A later
+    identical run restores them instead of running the command again.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to store the cache. It is created if it does not
+        exist.
+    max_size : int, optional
+        The maximal total size in bytes of the cache. If it is exceeded, the
+        least recently used entries are removed. Default is unlimited.
+
+    Examples
+    --------
+    >>> from tempfile import mkdtemp
+    >>> from shutil import rmtree
+    >>> from dumpling import ArgmntParam, Parameters, ResultCache, dumpling_factory
+    >>> Echo = dumpling_factory('echo', 'echo', Parameters(ArgmntParam('msg')))
+    >>> tmpd = mkdtemp()
+    >>> cache = ResultCache(tmpd)
+    >>> app = Echo()
+    >>> app.update(msg='hello')
+    >>> app(cache=cache).stdout
+    'hello\\n'
+    >>> len(cache)
+    1
+    >>> app(cache=cache).stdout    # restored from the cache
+    'hello\\n'
+    >>> rmtree(tmpd)
+    '''
+    _result = 'result.json'
+
+    def __init__(self, directory, max_size=None):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        '''Return the number of cached results.'''
+        return len(self._entries())
+
+    def _entries(self):
+        '''Return the paths of the cached entries.'''
+        return [e.path for e in os.scandir(self.directory)
+                if e.is_dir() and not e.name.startswith('.')]
+
+    def key(self, app, stdin=None, cwd=None, stdout=PIPE, stderr=PIPE):
+        '''Return the key identifying a run of the app.
+
+        Parameters
+        ----------
+        app : Dumpling
+            The app controller to run.
+        stdin : arbitrary
+            The stdin passed to the run.
+        cwd : str, optional
+            The working dir of the run. The relative input paths are
+            resolved against it.
+        stdout, stderr : arbitrary
+            The stdout and stderr passed to the run.
+
+        Returns
+        -------
+        str or None
+            The key, or `None` if the run can not be cached because an
+            input file is missing, the stdin is not a file path nor
+            `subprocess.PIPE`, or the stdout or stderr is not a file
+            path, `subprocess.PIPE` nor `subprocess.DEVNULL`.
+        '''
+        if not (stdin is None or stdin is PIPE or isinstance(stdin, str)):
+            return None
+        streams = []
+        for f in (stdout, stderr):
+            if isinstance(f, str):
+                streams.append(os.path.abspath(f))
+            elif f is PIPE or f is DEVNULL:
+                streams.append(f)
+            else:
+                # the inherited output can not be replayed
+                return None
+        paths = app.params.paths('in')
+        if isinstance(stdin, str):
+            paths.append(stdin)
+        paths = [os.path.abspath(os.path.join(cwd or '', i)) for i in paths]
+        try:
+            inputs = [[i, _digest(i)] for i in paths]
+        except OSError:
+            return None
+        data = [app.version, app.command, inputs, stdin is PIPE, streams]
+        return sha256(json.dumps(data).encode()).hexdigest()
+
+    def get(self, key, args, outputs, cwd=None):
+        '''Return the cached result and restore the output files.
+
+        Parameters
+        ----------
+        key : str
+            The key of the run.
+        args : list of str
+            The command args list of the run.
+        outputs : list of str
+            The paths to restore the output files to.
+        cwd : str
+            The working dir the output paths are relative to.
+
+        Returns
+        -------
+        `subprocess.CompletedProcess` or None
+            `None` if the result is not cached.
         '''
-        return key in self._data or key in self._name_map
+        entry = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(entry, self._result)) as f:
+                result = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if result['outputs'] != outputs:
+            return None
+        try:
+            for i, dst in enumerate(outputs):
+                _copy(os.path.join(entry, str(i)), os.path.join(cwd or '', dst))
+        except FileNotFoundError:
+            # the entry is being evicted
+            return None
+        # mark it as recently used
+        os.utime(entry)
+        return CompletedProcess(args, result['returncode'], result['stdout'], result['stderr'])
 
-    def __getitem__(self, key):
-        '''Return the :class:`.Param` child class object by key.
+    def put(self, key, proc, outputs, cwd=None):
+        '''Store the result of a run.
 
         Parameters
         ----------
         key : str
-            The name or flag of the parameter to be retrieved.
+            The key of the run.
+        proc : `subprocess.CompletedProcess`
+            The result of the run.
+        outputs : list of str
+            The paths of the output files of the run.
+        cwd : str
+            The working dir the output paths are relative to.
         '''
-        if key in self._data:
-            return self._data[key]
-        elif key in self._name_map:
-            return self._data[self._name_map[key]]
-        else:
-            raise KeyError(key)
+        tmpd = mkdtemp(prefix='.', dir=self.directory)
+        try:
+            for i, src in enumerate(outputs):
+                _copy(os.path.join(cwd or '', src), os.path.join(tmpd, str(i)))
+            result = {'returncode': proc.returncode, 'stdout': proc.stdout,
+                      'stderr': proc.stderr, 'outputs': outputs}
+            with open(os.path.join(tmpd, self._result), 'w') as f:
+                json.dump(result, f)
+            # make the new entry visible atomically
+            os.rename(tmpd, os.path.join(self.directory, key))
+        except OSError:
+            # the output is missing or the same entry has been stored
+            shutil.rmtree(tmpd, ignore_errors=True)
+            return
+        self.evict()
 
-    def __setitem__(self, k, v):
-        '''Set the value of specified paramter.
+    def evict(self):
+        '''Remove the least recently used entries to fit into the size limit.'''
+        if self.max_size is None:
+            return
+        entries = []
+        for entry in self._entries():
+            try:
+                entries.append((os.path.getmtime(entry), _size(entry), entry))
+            except FileNotFoundError:
+                pass
+        total = sum(i[1] for i in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        '''Remove all the cached results.'''
+        for entry in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+class SingleFlight:
+    '''Share a single run among identical concurrent runs.
+
+    While a run is going on, the identical runs started by other callers
+    do not spawn their own processes. They wait for it instead and get
+    the same result. A run is identified by the app version, its
+    command args list, its working dir and its standard IO streams. It
+    is only shared while it is going on; use :class:`.ResultCache` to
+    reuse finished results.
+
+    The same object can be used by the threaded and the :mod:`asyncio`
+    runs at the same time.
+
+    Examples
+    --------
+    >>> from dumpling import ArgmntParam, Parameters, SingleFlight, BatchRunner, dumpling_factory
+    >>> Sleep = dumpling_factory('sleep', ['sh', '-c', 'sleep 0.2; echo $$'], Parameters())
+    >>> flight = SingleFlight()
+    >>> with BatchRunner(4) as runner:
+    ...     results = list(runner.map(Sleep(), [{}] * 4, flight=flight))
+    >>> len({p.stdout for p in results})   # they share the same pid
+    1
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def __len__(self):
+        '''Return the number of the runs going on.'''
+        return len(self._calls)
+
+    def key(self, app, cwd=None, stdin=PIPE, stdout=PIPE, stderr=PIPE, input=None, text=True):
+        '''Return the key identifying a run of the app.
 
         Parameters
         ----------
-        k : str
-            The name or flag of a parameter.
-        v : arbitrary object
-            The new value of the parameter.
+        app : Dumpling
+            The app controller to run.
+        cwd, stdin, stdout, stderr, input, text : arbitrary
+            The arguments passed to the run.
 
-        Raises
-        ------
-        ValueError
-            If the key is not in this :class:`.Parameters` object.
+        Returns
+        -------
+        str or None
+            The key, or `None` if the run can not be shared because it is
+            given its own input data, file objects, buffers or
+            :class:`.PipeInput`.
         '''
-        if k in self:
-            self[k].on(v)
+        if input is not None or _pipe_inputs(app.params):
+            return None
+        streams = []
+        for f in (stdin, stdout, stderr):
+            if isinstance(f, str):
+                streams.append(os.path.abspath(f))
+            elif f is None or f is PIPE or f is DEVNULL:
+                streams.append(f)
+            else:
+                return None
+        data = [app.version, app.command, os.path.abspath(cwd or os.curdir), streams, text]
+        return sha256(json.dumps(data).encode()).hexdigest()
+
+    def _join(self, key):
+        '''Return the future of the run and whether the caller should run it.'''
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _leave(self, key, future, result=None, exc=None):
+        with self._lock:
+            del self._calls[key]
+        if exc is None:
+            future.set_result(result)
+        elif isinstance(exc, Exception):
+            future.set_exception(exc)
         else:
-            msg = 'You cannot set value {!r} on unknown key {!r}'
-            raise ValueError(msg.format(v, k))
+            # the run is interrupted; one of the waiting callers takes over
+            future.cancel()
 
-    def update(self, **kwargs):
-        '''Update the parameter values.
+    def do(self, key, fn):
+        '''Call `fn` unless an identical call is going on, and return its result.
 
         Parameters
         ----------
-        kwargs : dict
-            keyword arguments. The key and value to update the parameters
-            in this :class:`.Parameters` object.
-
-        Notes
-        -----
-        If multiple keys of the same parameter are given, the flag key will
-        be overwritten by the name key. See the examples.
-
-        Examples
-        --------
-        >>> from dumpling import OptionParam, Parameters
-        >>> p = Parameters(*[OptionParam('--threads', name='cpus'), OptionParam('-i')])
-        >>> p
-        OptionParam(flag='--threads', alter=None, name='cpus', value=None, action=<lambda>, help='', delimiter=' ')
-        OptionParam(flag='-i', alter=None, name='i', value=None, action=<lambda>, help='', delimiter=' ')
-        >>> p.update(cpus=2, **{'--threads': 1})
-        >>> p   # '--threads' is overridden by 'cpus'
-        OptionParam(flag='--threads', alter=None, name='cpus', value=2, action=<lambda>, help='', delimiter=' ')
-        OptionParam(flag='-i', alter=None, name='i', value=None, action=<lambda>, help='', delimiter=' ')
-        >>> p.update(**{'cpus': 3, '--threads': 1})
-        >>> p
-        OptionParam(flag='--threads', alter=None, name='cpus', value=3, action=<lambda>, help='', delimiter=' ')
-        OptionParam(flag='-i', alter=None, name='i', value=None, action=<lambda>, help='', delimiter=' ')
+        key : str
+            The key of the run.
+        fn : callable
+            The function to call without arguments.
         '''
-        for k in sorted(kwargs):
-            self[k] = kwargs[k]
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = fn()
+                except BaseException as e:
+                    self._leave(key, future, exc=e)
+                    raise
+                self._leave(key, future, result)
+                return result
+            try:
+                return future.result()
+            except CancelledError:
+                continue
 
-    def off(self):
-        '''Turn off all the parameters.'''
-        for k in self._data:
-            self[k].off()
+    async def do_async(self, key, fn):
+        '''Await `fn()` unless an identical call is going on, and return its result.
 
-    def __repr__(self):
-        '''String representation of the :class:`.Parameters` object.'''
-        items = []
-        for k in self._data:
-            items.append(repr(self._data[k]))
-        return '\n'.join(items)
+        This is the coroutine counterpart of :meth:`do`.
+        '''
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = await fn()
+                except BaseException as e:
+                    self._leave(key, future, exc=e)
+                    raise
+                self._leave(key, future, result)
+                return result
+            try:
+                # cancelling the waiting task must not cancel the shared run
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
 
 
-def dumpling_factory(name, cmd, params, version='', url=''):
+def dumpling_factory(name, cmd, params, version='', url='', threads=None, hooks=None,
+                     retry=None):
     '''dumpling factory.
 
     It creates a Python class for wrapping a command line tool.
@@ -621,6 +3243,14 @@ def dumpling_factory(name, cmd, params, version='', url=''):
         The version of the app.
     url : str
         URL of the app.
+    threads : str, optional
+        The name or flag of the parameter setting the number of threads
+        the app uses, e.g. '--cpu'.
+    hooks : list of callable, optional
+        The initial `hooks` of the class, called with each
+        :class:`.TraceEvent` of the runs.
+    retry : RetryPolicy, optional
+        The default policy to retry the runs failing transiently.
 
     Returns
     -------
@@ -697,6 +3327,15 @@ def dumpling_factory(name, cmd, params, version='', url=''):
     OptionParam(flag='-f', alter=None, name='f', value=None, action=<lambda>, help='force overwriting', delimiter=' ')
     ArgmntParam(name='input', value=None, action=<lambda>, help='input cm file')
     '''
+    if isinstance(cmd, str):
+        cmd = [cmd]
+    # the params shared by all the instances of the class
+    params = params.copy()
+    if threads is not None:
+        threads = params._name(threads)
+    # render the args of the shared params once for all the instances
+    params._argv()
+
     class Dumpling:
         '''Application controller.
 
@@ -710,6 +3349,8 @@ def dumpling_factory(name, cmd, params, version='', url=''):
             The version of the app.
         url : str
             URL of the app.
+        threads : str or None
+            The name of the parameter setting the number of threads.
 
         Attributes
         ----------
@@ -717,28 +3358,82 @@ def dumpling_factory(name, cmd, params, version='', url=''):
         params
         version
         url
+        threads
         command
+        hooks : list of callable
+            The class attribute of the callables called with each
+            :class:`.TraceEvent` of the runs, e.g. :class:`.JSONLinesTrace`
+            or :class:`.ChromeTrace`. Set it on an instance to trace only
+            its runs.
+        retry : RetryPolicy or None
+            The class attribute of the default retry policy of the runs.
         '''
         def __init__(self):
-            if isinstance(cmd, str):
-                cmd_ = [cmd]
-            else:
-                cmd_ = cmd
-            self.cmd = cmd_
-            self.params = deepcopy(params)
+            self.cmd = list(cmd)
+            self.params = params.copy()
             self.version = version
             self.url = url
+            self.threads = threads
 
         @property
         def command(self):
             '''Command args list passed to `subprocess.Popen`.'''
-            command = []
-            command.extend(self.cmd)
-            for k in self.params:
-                p = self.params[k]
-                command.extend(p._get_arg())
+            command = list(self.cmd)
+            command.extend(self.params._argv())
             return command
 
+        @property
+        def executable(self):
+            '''The absolute path of the command executable.
+
+            It is resolved in PATH once and cached until PATH or the file
+            changes; the commands are spawned with it. It is the command
+            itself if it is not found.'''
+            return _resolve(self.cmd[0])
+
+        def cpus(self):
+            '''Return the number of CPUs the command uses.
+
+            It is the value of the `threads` parameter, or 1 if the
+            parameter is not defined or is off.'''
+            if self.threads is None:
+                return 1
+            p = self.params._get(self.threads)
+            if p.is_off() or p.value is True:
+                return 1
+            return max(1, int(p.value))
+
+        def sweep(self, **axes):
+            '''Return the commands for all the combinations of the given values.
+
+            It is the same as :meth:`Parameters.sweep` but with the command
+            prepended to each args list.
+
+            Parameters
+            ----------
+            axes : dict
+                The key is the name or flag of a parameter and the value is
+                the iterable of values for the parameter.
+
+            Returns
+            -------
+            ~collections.abc.Iterator of list of str
+                The command args lists.
+
+            See Also
+            --------
+            Parameters.sweep
+            '''
+            cmd = self.cmd
+            return (cmd + argv for argv in self.params.sweep(**axes))
+
+        def copy(self):
+            '''Return a copy of this app controller with its own parameters.'''
+            new = object.__new__(self.__class__)
+            new.__dict__.update(self.__dict__)
+            new.params = self.params.copy()
+            return new
+
         def __repr__(self):
             '''Return string representation of this object.'''
             items = []
@@ -755,6 +3450,17 @@ def dumpling_factory(name, cmd, params, version='', url=''):
             '''Return the command run.'''
             return ' '.join(self.command)
 
+        def __or__(self, other):
+            '''Pipe the stdout of this app into the stdin of another app.
+
+            Returns
+            -------
+            Pipeline
+            '''
+            if isinstance(other, Pipeline):
+                return Pipeline(self, *other.apps)
+            return Pipeline(self, other)
+
         def update(self, **kwargs):
             '''Update the parameters in this app controller.
 
@@ -771,7 +3477,311 @@ def dumpling_factory(name, cmd, params, version='', url=''):
             '''
             self.params.update(**kwargs)
 
-        def __call__(self, cwd=None, stdin=PIPE, stdout=PIPE, stderr=PIPE, check=True):
+        def map(self, kwargs_list, max_workers=None, ordered=True, journal=None, **call_kwargs):
+            '''Run this app concurrently for many sets of parameters.
+
+            Each set of parameters updates a copy of this app, so this
+            object itself is not modified.
+
+            Parameters
+            ----------
+            kwargs_list : ~collections.abc.Iterable of dict
+                The parameter values for each run.
+            max_workers : int, optional
+                The maximal number of commands running at the same time.
+            ordered : bool
+                Yield the results in the input order or as they finish.
+            journal : BatchJournal, optional
+                The journal to record the runs in and skip those done.
+            call_kwargs : keyword arguments
+                Passed to the call of the app.
+
+            Yields
+            ------
+            `subprocess.CompletedProcess`
+
+            See Also
+            --------
+            BatchRunner
+            BatchJournal
+            '''
+            with BatchRunner(max_workers) as runner:
+                yield from runner.map(self, kwargs_list, ordered, journal, **call_kwargs)
+
+        def scatter(self, param, shards=None, record=None, merge=None, cwd=None,
+                    stdout=PIPE, stderr=PIPE, max_workers=None, tmpdir=None, **call_kwargs):
+            '''Split an input file into shards and run this app on them in parallel.
+
+            The input file is split by record boundaries into shards
+            (scatter). A copy of this app is run on every shard, with
+            each output parameter (declared with ``io='out'``) and the
+            stdout and stderr file paths rewritten to per-shard temporary
+            files. The per-shard outputs are then concatenated, or merged
+            with the given functions, in the shard order (gather).
+
+            Parameters
+            ----------
+            param : str
+                The name or flag of the parameter of the input file.
+            shards : int, optional
+                The number of shards. Default is the number of CPUs divided
+                by the number of CPUs used by each run (:meth:`cpus`). There
+                are fewer shards if the file has not enough records.
+            record : str, optional
+                The prefix of the first line of every record, e.g. ``'>'`` for
+                FASTA. By default it is ``'>'`` if the file starts with it,
+                otherwise every line is a record.
+            merge : dict, optional
+                The functions to merge the shard outputs of a parameter
+                (by name) or of ``'stdout'`` or ``'stderr'`` if they are
+                file paths. Each function is called with the list of the
+                shard output paths and the destination path. Default is
+                concatenation.
+            cwd : str
+                working dir
+            stdout, stderr : None, str, `subprocess.DEVNULL`, or `subprocess.PIPE` (default)
+                The stdout and stderr of the whole run. They can also be a
+                buffer or a :class:`.SpooledOutput`; each shard captures
+                into its own bytearray or :class:`.SpooledOutput` and the
+                outputs are joined into the given object in the shard
+                order. The :class:`.SpooledOutput` of the shards are
+                closed after they are joined.
+            max_workers : int, optional
+                The maximal number of shards running at the same time.
+            tmpdir : str, optional
+                The directory to create the temporary shard files in.
+            call_kwargs : keyword arguments
+                Passed to the call of the app on each shard.
+
+            Returns
+            -------
+            `subprocess.CompletedProcess`
+                The captured stdout and stderr are concatenated in the shard
+                order and the return code is the first non-zero one. Its
+                extra attribute `shards` is the list of the results of the
+                shards.
+
+            Examples
+            --------
+            >>> from tempfile import mkdtemp
+            >>> from shutil import rmtree
+            >>> from os.path import join
+            >>> from dumpling import ArgmntParam, Parameters, dumpling_factory
+            >>> Grep = dumpling_factory('grep', ['grep', '-c', '^>'], Parameters(ArgmntParam('fasta')))
+            >>> tmpd = mkdtemp()
+            >>> with open(join(tmpd, 'seqs.fa'), 'w') as f:
+            ...     _ = f.write('>a\\nAC\\n>b\\nGT\\n>c\\nTT\\n')
+            >>> app = Grep()
+            >>> app.update(fasta=join(tmpd, 'seqs.fa'))
+            >>> proc = app.scatter('fasta', shards=2)
+            >>> proc.stdout
+            '2\\n1\\n'
+            >>> len(proc.shards)
+            2
+            >>> rmtree(tmpd)
+            '''
+            name = self.params._name(param)
+            if shards is None:
+                shards = max(1, (os.cpu_count() or 1) // self.cpus())
+            tmpd = mkdtemp(prefix='dumpling-', dir=tmpdir)
+            try:
+                src = os.path.join(cwd or '', str(self.params._get(name).value))
+                apps = []
+                for path in _split(src, shards, tmpd, record):
+                    apps.append(self.copy())
+                    apps[-1].update(**{name: path})
+                proc, results = self._gather(tmpd, apps, merge, cwd, stdout, stderr,
+                                             max_workers, call_kwargs)
+            finally:
+                shutil.rmtree(tmpd, ignore_errors=True)
+            proc.shards = results
+            return proc
+
+        def xargs(self, param, max_args=None, merge=None, cwd=None, stdout=PIPE, stderr=PIPE,
+                  max_workers=None, tmpdir=None, **call_kwargs):
+            '''Split the values of a list parameter over parallel runs of this app.
+
+            Like xargs, the values of the :class:`.ArgmntListParam` are
+            split into batches so that the args list of each run fits
+            into the system limit (``ARG_MAX``) along with the
+            environment. The batches are run in parallel and their
+            outputs are gathered in order like in :meth:`scatter`.
+
+            Parameters
+            ----------
+            param : str
+                The name of the :class:`.ArgmntListParam`.
+            max_args : int, optional
+                The maximal number of values in each run. Default is to
+                spread the values evenly over `max_workers` runs, or more
+                if they do not fit.
+            merge, cwd, stdout, stderr, tmpdir, call_kwargs
+                The same as in :meth:`scatter`.
+            max_workers : int, optional
+                The maximal number of runs at the same time. Default is the
+                number of CPUs divided by the number of CPUs used by each run
+                (:meth:`cpus`).
+
+            Returns
+            -------
+            `subprocess.CompletedProcess`
+                The captured stdout and stderr are concatenated in the batch
+                order and the return code is the first non-zero one. Its
+                extra attribute `batches` is the list of the results of the
+                batches.
+
+            Raises
+            ------
+            TypeError
+                If the parameter is not an :class:`.ArgmntListParam`.
+
+            Examples
+            --------
+            >>> from dumpling import ArgmntListParam, Parameters, dumpling_factory
+            >>> Echo = dumpling_factory('echo', 'echo', Parameters(ArgmntListParam('words')))
+            >>> app = Echo()
+            >>> app.update(words=['a', 'b', 'c'])
+            >>> proc = app.xargs('words', max_args=2)
+            >>> proc.stdout
+            'a b\\nc\\n'
+            >>> [p.args for p in proc.batches]
+            [['echo', 'a', 'b'], ['echo', 'c']]
+            '''
+            name = self.params._name(param)
+            p = self.params._get(name)
+            if not isinstance(p, ArgmntListParam):
+                raise TypeError('Parameter {!r} is not an ArgmntListParam.'.format(name))
+            items = p.value or ()
+            if max_workers is None:
+                max_workers = max(1, (os.cpu_count() or 1) // self.cpus())
+            if max_args is None:
+                max_args = max(1, -(-len(items) // max_workers))
+            base = self.copy()
+            base.params[name]._value = ()
+            apps = []
+            for batch in _batches(base.command, items, _arg_max(), max_args):
+                apps.append(self.copy())
+                # the items are already processed by the action
+                apps[-1].params[name]._value = tuple(batch)
+            tmpd = mkdtemp(prefix='dumpling-', dir=tmpdir)
+            try:
+                proc, results = self._gather(tmpd, apps, merge, cwd, stdout, stderr,
+                                             max_workers, call_kwargs)
+            finally:
+                shutil.rmtree(tmpd, ignore_errors=True)
+            proc.batches = results
+            return proc
+
+        def _gather(self, tmpd, apps, merge, cwd, stdout, stderr, max_workers, call_kwargs):
+            '''Run the apps in parallel and gather their outputs in order.
+
+            The output parameters and the stdout and stderr paths of each
+            app are rewritten into its own sub dir of the temporary dir.
+
+            Returns
+            -------
+            tuple
+                The merged `subprocess.CompletedProcess` and the list of the
+                results of the apps.
+            '''
+            merge = {} if merge is None else merge
+            # the destination of each output and its path in the dir of an
+            # app; each value of a list parameter is put in its own sub dir
+            outputs = []
+            for p in self.params._values():
+                if p.io == 'out' and p.is_on():
+                    many = isinstance(p, ArgmntListParam)
+                    files = [(os.path.join(cwd or '', dst),
+                              os.path.join('{}.{}'.format(p.name, j), os.path.basename(dst))
+                              if many else os.path.basename(dst))
+                             for j, dst in enumerate(p._paths())]
+                    outputs.append((p.name, many, files))
+            streams = [(n, f) for n, f in (('stdout', stdout), ('stderr', stderr))
+                       if isinstance(f, str)]
+            # each app captures into its own object, joined in order afterwards
+            captures = {n: f for n, f in (('stdout', stdout), ('stderr', stderr))
+                        if _is_capture(f)}
+            futures = []
+            with BatchRunner(max_workers or len(apps)) as runner:
+                for i, app in enumerate(apps):
+                    part = os.path.join(tmpd, str(i))
+                    os.mkdir(part)
+                    kwargs = {}
+                    for n, many, files in outputs:
+                        paths = [os.path.join(part, rel) for _, rel in files]
+                        for path in paths:
+                            os.makedirs(os.path.dirname(path), exist_ok=True)
+                        kwargs[n] = paths if many else paths[0]
+                    files = {n: os.path.join(part, n) for n, _ in streams}
+                    files.update((n, _new_capture(f)) for n, f in captures.items())
+                    futures.append(runner.submit(
+                        app, kwargs, cwd=cwd, stdout=files.get('stdout', stdout),
+                        stderr=files.get('stderr', stderr), **call_kwargs))
+                results = [f.result() for f in futures]
+            for n, _, files in outputs:
+                for dst, rel in files:
+                    parts = [os.path.join(tmpd, str(i), rel) for i in range(len(apps))]
+                    merge.get(n, _concat)(parts, dst)
+            for n, dst in streams:
+                parts = [os.path.join(tmpd, str(i), n) for i in range(len(apps))]
+                merge.get(n, _concat)(parts, dst)
+            empty = '' if call_kwargs.get('text', True) else b''
+            out, err = [_join_into(captures[a], [getattr(r, a) for r in results])
+                        if a in captures
+                        else None if all(getattr(r, a) is None for r in results)
+                        else empty.join(getattr(r, a) or empty for r in results)
+                        for a in ('stdout', 'stderr')]
+            returncode = next((r.returncode for r in results if r.returncode), 0)
+            return CompletedProcess(self.command, returncode, out, err), results
+
+        def _open_pipes(self):
+            '''Open the :class:`.PipeInput` values before rendering the command.'''
+            return [p._open() for p in _pipe_inputs(self.params)]
+
+        def _io_paths(self, stdin=None, stdout=None, stderr=None):
+            '''Return the input and output paths of a run.
+
+            The standard IO streams given as file paths are included as
+            absolute paths, because they are opened in the current dir
+            instead of the working dir of the command.'''
+            inputs = self.params.paths('in')
+            outputs = self.params.paths('out')
+            if isinstance(stdin, str):
+                inputs.append(os.path.abspath(stdin))
+            outputs.extend(os.path.abspath(f) for f in (stdout, stderr) if isinstance(f, str))
+            return inputs, outputs
+
+        def up_to_date(self, cwd=None, stdin=None, stdout=None, stderr=None):
+            '''Return True if the outputs of the command are up to date.
+
+            The outputs are up to date if every declared output path exists
+            and is not older than any declared input path. The parameters
+            are declared as input or output with their `io` attribute.
+            The app without any parameter declared with ``io='out'`` is
+            never up to date, so it is always run.
+
+            Parameters
+            ----------
+            cwd : str
+                The working dir the declared paths are relative to.
+            stdin, stdout, stderr : arbitrary
+                The standard IO streams. Those given as file paths are
+                also considered as input or output if the app declares
+                an output.
+
+            Returns
+            -------
+            bool
+                Always False if there is no declared output.
+            '''
+            if not self.params.paths('out'):
+                return False
+            inputs, outputs = self._io_paths(stdin, stdout, stderr)
+            return _up_to_date(inputs, outputs, cwd)
+
+        def __call__(self, cwd=None, stdin=PIPE, stdout=PIPE, stderr=PIPE, check=True,
+                     cache=None, force=False, input=None, timeout=None, cancel=None, grace=5,
+                     flight=None, text=True, retry=None):
             '''Run the command.
 
             Parameters
@@ -780,10 +3790,78 @@ def dumpling_factory(name, cmd, params, version='', url=''):
                 working dir
             stdin, stdout, stderr : None, str, `subprocess.DEVNULL`, or `subprocess.PIPE` (default)
                 file path to store output. Use `subprocess.DEVNULL` to suppress stdout or stderr.
+                The stdout and stderr can also be a `bytearray`, `memoryview`
+                or `mmap.mmap` to read the output into directly. A bytearray
+                is resized to the output; the output must fit into the other
+                buffers, otherwise `BufferError` is raised. They can also be
+                a :class:`.SpooledOutput` to keep small output in memory
+                and spill large output to disk.
+            input : bytes, str, file-like object, or ~collections.abc.Iterable of bytes or str, optional
+                The data fed into the stdin of the command. It is written
+                from a thread as the command reads it, so a generator of
+                chunks is never loaded in memory as a whole. The stdin
+                must be `subprocess.PIPE` if it is given.
+            check : bool
+                Raise `subprocess.CalledProcessError` if the command exits
+                with non-zero code.
+            cache : ResultCache, optional
+                Look up the result in the cache before running the command
+                and store it after a successful run. The runs given `input`
+                or :class:`.PipeInput` data and those with the stdout or
+                stderr inherited (`None`) are not cached.
+            force : bool
+                Run the command even if its outputs are up to date. If it is
+                `False`, the command is skipped when :meth:`up_to_date`
+                returns True, and the returned result has zero return code
+                and `None` stdout and stderr.
+            timeout : float, optional
+                Kill the command if it does not finish in these seconds.
+            cancel : CancelHandle, optional
+                Kill the command when the handle is cancelled.
+            grace : float
+                The seconds to wait after SIGTERM before SIGKILL when the
+                command is killed on timeout or cancellation.
+            flight : SingleFlight, optional
+                Wait for an identical run going on instead of running the
+                command again. The shared run is done with the `timeout`
+                and `cancel` of the caller that started it.
+            text : bool
+                Decode the output captured with `subprocess.PIPE` to str
+                (default) or return it as bytes.
+            retry : RetryPolicy or False, optional
+                Retry the command if it fails transiently. Default is the
+                `retry` of the app; `False` disables it. The command is not
+                retried if its `input` or the data of a :class:`.PipeInput`
+                is an iterator or a file, which can not be fed again, if a
+                standard IO stream is a file object, which is closed after
+                the run, or if it is cancelled. If the stdout or stderr is
+                a buffer or a :class:`.SpooledOutput`, each attempt
+                captures into its own bytearray or
+                :class:`.SpooledOutput` and the output of the last one is
+                copied into the given object.
 
             Returns
             -------
             `subprocess.CompletedProcess`
+                The output captured into a bytearray or a
+                :class:`.SpooledOutput` is the object itself and that
+                captured into other buffers is a memoryview of the part
+                filled. Its extra attribute `usage` is the
+                :class:`.ResourceUsage` of the run, or `None` if the command
+                did not run because the result was cached or up to date. Its
+                extra attribute `attempts` is the list of the results of all
+                the attempts, including itself and the
+                `subprocess.TimeoutExpired` of those killed on timeout. The
+                callers sharing a run with `flight` get the same object.
+
+            Raises
+            ------
+            subprocess.CalledProcessError
+                If `check` is True and the command exits with non-zero code.
+            subprocess.TimeoutExpired
+                If the command is killed on timeout.
+            ProcessCancelled
+                If the command is killed on cancellation.
 
             Notes
             -----
@@ -791,25 +3869,472 @@ def dumpling_factory(name, cmd, params, version='', url=''):
             will be collected into memory. If you expect large volume of them,
             supply file path to store the standard IO streams instead to avoid
             memory blowup.
+
+            The command runs in its own session, so a timeout or a
+            cancellation kills all the processes it spawns as well.
+
+            The run is traced with the :attr:`hooks` of the app.
             '''
+            trace = None
+            if self.hooks:
+                run_id = next(_run_ids)
+                trace = self._tracer(run_id)
+                trace('start')
+            if retry is None:
+                retry = self.retry
+            # the input that can be fed again
+            replayable = (_replayable(input)
+                          and all(_replayable(p.data) for p in _pipe_inputs(self.params))
+                          # the file objects are closed after the run
+                          and not any(hasattr(f, 'close') and not _is_capture(f)
+                                      for f in (stdin, stdout, stderr)))
+            # each attempt captures into its own object when it may be
+            # retried; the last one is joined into the given object
+            captures = {}
+            if retry and replayable:
+                captures = {n: f for n, f in (('stdout', stdout), ('stderr', stderr))
+                            if _is_capture(f)}
+            proc = None
             try:
-                if isinstance(stdin, str):
-                    stdin = open(stdin, 'r')
-                if isinstance(stdout, str):
-                    stdout = open(stdout, 'w+')
-                if isinstance(stderr, str):
-                    stderr = open(stderr, 'w+')
-                proc = run(self.command, cwd=cwd, shell=False,
-                           stdin=stdin, stdout=stdout, stderr=stderr,
-                           universal_newlines=True, check=check)
-
+                attempts = []
+                while True:
+                    files = {n: _new_capture(f) for n, f in captures.items()}
+                    try:
+                        result = self._call(cwd, stdin, files.get('stdout', stdout),
+                                            files.get('stderr', stderr), False, cache, force,
+                                            input, timeout, cancel, grace, flight, text, trace)
+                    except TimeoutExpired as e:
+                        if not retry:
+                            raise
+                        result = e
+                    attempts.append(result)
+                    if (not retry or len(attempts) >= retry.attempts or not replayable
+                            or (cancel is not None and cancel.cancelled)
+                            or not retry.transient(result)):
+                        break
+                    if cancel is None:
+                        time.sleep(retry.delay(len(attempts)))
+                    elif cancel._wait(retry.delay(len(attempts))):
+                        break
+                for n, f in captures.items():
+                    setattr(result, n, _join_into(f, [getattr(result, n)]))
+                if isinstance(result, TimeoutExpired):
+                    raise result
+                result.attempts = attempts
+                if check:
+                    result.check_returncode()
+                proc = result
             finally:
-                for f in [stdin, stdout, stderr]:
+                if trace is not None:
+                    trace('end', returncode=proc and proc.returncode)
+            return proc
+
+        def _tracer(self, run_id):
+            '''Return the function to call the hooks with the events of a run.'''
+            hooks = list(self.hooks)
+            app = self.__class__.__name__
+            # the args rendered at the first event after 'start'
+            args = []
+
+            def trace(event, pid=None, returncode=None):
+                if event != 'start' and not args:
+                    args.append(self.command)
+                e = TraceEvent(event, time.perf_counter_ns(), app, run_id, args[0] if args else None,
+                               pid, threading.get_ident(), returncode)
+                for hook in hooks:
+                    hook(e)
+            return trace
+
+        def _call(self, cwd, stdin, stdout, stderr, check, cache, force, input,
+                  timeout, cancel, grace, flight, text, trace):
+            '''Run the command; see :meth:`__call__`.'''
+            _, outputs = self._io_paths(stdin, stdout, stderr)
+            if not force and self.up_to_date(cwd, stdin, stdout, stderr):
+                proc = CompletedProcess(self.command, 0)
+                proc.usage = None
+                return proc
+
+            def run():
+                key = None
+                # only the text output captured in memory of the run not
+                # fed in-memory data can be cached
+                if (cache is not None and input is None and text
+                        and not (_is_capture(stdout) or _is_capture(stderr))
+                        and not _pipe_inputs(self.params)):
+                    key = cache.key(self, stdin, cwd, stdout, stderr)
+                    if key is not None:
+                        proc = cache.get(key, self.command, outputs, cwd)
+                        if proc is not None:
+                            proc.usage = None
+                            return proc
+                with _std_files(stdin, stdout, stderr) as files:
+                    pipes = self._open_pipes()
+                    proc = _run(self.command, cwd, *files, input, pipes, text,
+                                timeout=timeout, cancel=cancel, grace=grace, trace=trace)
+                if key is not None and proc.returncode == 0:
+                    cache.put(key, proc, outputs, cwd)
+                return proc
+
+            key = None
+            if flight is not None:
+                key = flight.key(self, cwd, stdin, stdout, stderr, input, text)
+            proc = run() if key is None else flight.do(key, run)
+            if check:
+                proc.check_returncode()
+            return proc
+
+        def stream(self, cwd=None, stdin=PIPE, stderr=PIPE, check=True, text=True, chunk_size=None,
+                   input=None):
+            '''Run the command and iterate over its stdout as it is produced.
+
+            Unlike calling the app, the stdout is never buffered as a
+            whole, so the output of any size can be parsed with bounded
+            memory.
+
+            Parameters
+            ----------
+            cwd : str
+                working dir
+            stdin, stderr : None, str, `subprocess.DEVNULL`, or `subprocess.PIPE` (default)
+                The stdin and stderr of the command.
+            check : bool
+                Raise `subprocess.CalledProcessError` at the end of the
+                iteration if the command exits with non-zero code.
+            text : bool
+                Yield str if `True` (default); otherwise yield bytes.
+            chunk_size : int, optional
+                Yield chunks of at most this size instead of lines.
+            input : bytes, str, file-like object, or ~collections.abc.Iterable of bytes or str, optional
+                The data fed into the stdin of the command.
+
+            Returns
+            -------
+            ProcessStream
+                The context-managed iterator over the stdout.
+            '''
+            pipes = self._open_pipes()
+            return ProcessStream(self.command, cwd, stdin, stderr, check, text, chunk_size,
+                                 input, pipes)
+
+        async def run_async(self, cwd=None, stdin=PIPE, stdout=PIPE, stderr=PIPE, check=True,
+                            flight=None, text=True):
+            '''Run the command as an :mod:`asyncio` subprocess.
+
+            This is the coroutine counterpart of calling the app. It does
+            not block the event loop or use any extra thread, except those
+            feeding the data of :class:`.PipeInput` values, so many
+            commands can be run at the same time on a single event loop.
+
+            Parameters
+            ----------
+            cwd : str
+                working dir
+            stdin, stdout, stderr : None, str, `subprocess.DEVNULL`, or `subprocess.PIPE` (default)
+                file path to store output. Use `subprocess.DEVNULL` to suppress stdout or stderr.
+            check : bool
+                Raise `subprocess.CalledProcessError` if the command exits
+                with non-zero code.
+            flight : SingleFlight, optional
+                Wait for an identical run going on instead of running the
+                command again.
+            text : bool
+                Decode the captured output to str (default) or return it as
+                bytes.
+
+            Returns
+            -------
+            `subprocess.CompletedProcess`
+
+            Notes
+            -----
+            If the awaiting task is cancelled, the child process is killed,
+            unless other tasks are waiting for it with `flight`.
+
+            Examples
+            --------
+            >>> import asyncio
+            >>> from dumpling import ArgmntParam, Parameters, dumpling_factory
+            >>> Echo = dumpling_factory('echo', 'echo', Parameters(ArgmntParam('msg')))
+            >>> app = Echo()
+            >>> app.update(msg='hello')
+            >>> proc = asyncio.run(app.run_async())
+            >>> proc.stdout
+            'hello\\n'
+            '''
+            async def run():
+                pipes = self._open_pipes()
+                command = self.command
+                with _std_files(stdin, stdout, stderr) as files:
+                    try:
+                        proc = await asyncio.create_subprocess_exec(
+                            *command, executable=_resolve(command[0]), cwd=cwd,
+                            stdin=files[0], stdout=files[1], stderr=files[2],
+                            pass_fds=[p.fd for p in pipes])
+                    except BaseException:
+                        for p in pipes:
+                            p._close()
+                        raise
+                    workers = [p._start() for p in pipes]
                     try:
-                        f.close()
-                    except AttributeError:
-                        pass
+                        out, err = await proc.communicate()
+                    except asyncio.CancelledError:
+                        proc.kill()
+                        await proc.wait()
+                        raise
+                    for w in workers:
+                        # the child has exited, so the feeding is finishing
+                        await asyncio.to_thread(w.get)
+                if text:
+                    out, err = _decode(out), _decode(err)
+                return CompletedProcess(command, proc.returncode, out, err)
+
+            key = None
+            if flight is not None:
+                key = flight.key(self, cwd, stdin, stdout, stderr, text=text)
+            proc = await (run() if key is None else flight.do_async(key, run))
+            if check:
+                proc.check_returncode()
             return proc
 
     Dumpling.__name__ = name
+    Dumpling.hooks = list(hooks or ())
+    Dumpling.retry = retry
     return Dumpling
+
+
+# a metavar after a flag, e.g. <x>, FILE, {a,b} or [N]
+_METAVAR = r'(?:<[^>]*>|\{[^}]*\}|\[[^\]]*\]|[A-Z][A-Z0-9_-]*)'
+_FLAG = re.compile(r'(--?[A-Za-z0-9][\w.-]*)(?:(=)\S+|( )' + _METAVAR + ')?')
+# the flags and the help of an option, separated by a colon or 2+ spaces
+_OPTION = re.compile(r'^\s{0,8}(--?[A-Za-z0-9].*?)(?:\s*:\s+|\s{2,}|\t+|$)(.*)$')
+_USAGE = re.compile(r'^\s*usage:\s*(.*(?:\n[ \t]+\S.*)*)', re.I | re.M)
+_DEFAULT = re.compile(r'[(\[]default[:=]?\s*([^)\]]*)[)\]]|\[([^\]\s]+)\](?=\s*(?:\(|$))', re.I)
+
+
+def _parse_help(text):
+    '''Parse the help message of a command into the parameter schema.
+
+    The options are the indented lines starting with flags, like those of
+    :mod:`argparse`, getopt or HMMER style help messages. The positional
+    arguments are taken from the usage line.
+
+    Returns
+    -------
+    list of dict
+        The options, followed by the positional arguments, in the order
+        they appear.
+
+    Examples
+    --------
+    >>> text = """Usage: cmscan [-options] <cmdb> <seqfile>
+    ...
+    ... Basic options:
+    ...   -h         : show brief help on version and usage
+    ...   -E <x>     : report sequences <= this E-value threshold  [10.0]  (x>0)
+    ...   -o, --output=FILE  direct output to file
+    ...   --cpu <n>  : number of parallel CPU workers to use  [2]
+    ...                (default is fine)
+    ... """
+    >>> for p in _parse_help(text):
+    ...     print(p)
+    {'type': 'option', 'flag': '-h', 'alter': None, 'delimiter': ' ', 'help': 'show brief help on version and usage', 'default': None}
+    {'type': 'option', 'flag': '-E', 'alter': None, 'delimiter': ' ', 'help': 'report sequences <= this E-value threshold  [10.0]  (x>0)', 'default': '10.0'}
+    {'type': 'option', 'flag': '--output', 'alter': '-o', 'delimiter': '=', 'help': 'direct output to file', 'default': None}
+    {'type': 'option', 'flag': '--cpu', 'alter': None, 'delimiter': ' ', 'help': 'number of parallel CPU workers to use  [2] (default is fine)', 'default': '2'}
+    {'type': 'argument', 'name': 'cmdb', 'help': ''}
+    {'type': 'argument', 'name': 'seqfile', 'help': ''}
+    '''
+    options = []
+    helps = {}
+    last = None
+    for line in text.splitlines():
+        m = _OPTION.match(line)
+        flags = [] if m is None else _FLAG.findall(m.group(1))
+        if flags:
+            names = [f[0] for f in flags]
+            long = [f for f in names if f.startswith('--')]
+            flag = long[0] if long else names[0]
+            alter = next((f for f in names if f != flag), None)
+            delimiter = '=' if any(f[1] for f in flags) else ' '
+            last = {'type': 'option', 'flag': flag, 'alter': alter,
+                    'delimiter': delimiter, 'help': m.group(2).strip()}
+            options.append(last)
+        elif not line.strip() or not line[0].isspace():
+            last = None
+        elif last is not None:
+            # the help continued on the next line
+            last['help'] = ' '.join(i for i in (last['help'], line.strip()) if i)
+        else:
+            # the help of a positional argument, e.g. in argparse
+            words = line.split(None, 1)
+            helps.setdefault(words[0], words[1].strip() if len(words) > 1 else '')
+    for p in options:
+        # a bare "(default)" marks a flag on by default and has no value
+        defaults = ((m.group(1) or m.group(2) or '').strip() for m in _DEFAULT.finditer(p['help']))
+        default = next((d for d in defaults if d), None)
+        p['default'] = None if default == 'None' else default
+
+    arguments = []
+    m = _USAGE.search(text)
+    # skip the program name
+    tokens = [] if m is None else re.findall(r'\[|\]|[^\s\[\]|]+', m.group(1))[1:]
+    # whether each open bracket group is an option group
+    groups = []
+    first = after_flag = False
+    for tok in tokens:
+        if tok == '[':
+            groups.append(False)
+            first = True
+            continue
+        elif tok == ']':
+            if groups:
+                groups.pop()
+            continue
+        if first and tok.startswith('-'):
+            groups[-1] = True
+        first = False
+        if any(groups):
+            continue
+        if tok.startswith('-'):
+            after_flag = True
+            continue
+        if after_flag and re.fullmatch(_METAVAR, tok):
+            # the value of a required option
+            after_flag = False
+            continue
+        after_flag = False
+        name = tok.rstrip('.')
+        if not name or name.startswith('{') or name.strip('<>').lower() in ('option', 'options'):
+            continue
+        help = helps.get(name, '')
+        name = re.sub(r'\W', '_', name.strip('<>').lower())
+        if not name.isidentifier() or iskeyword(name):
+            name = 'arg_' + name
+        arguments.append({'type': 'argument', 'name': name, 'help': help})
+    return options + arguments
+
+
+def _help_schema(cmd, help_flag='--help', version='', cache_dir=None, timeout=60):
+    '''Return the parameter schema parsed from the help of the command.
+
+    The schema is cached in the directory, keyed by the real path and
+    mtime of the executable and the version, so the command is only run
+    once until it is updated.'''
+    exe = shutil.which(cmd[0])
+    if exe is None:
+        raise FileNotFoundError('Command not found: {}'.format(cmd[0]))
+    exe = os.path.realpath(exe)
+    if cache_dir is None:
+        cache_dir = os.path.join(
+            os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache')),
+            'dumpling')
+    key = [exe, os.stat(exe).st_mtime_ns, cmd[1:], help_flag, version]
+    path = os.path.join(cache_dir, sha256(json.dumps(key).encode()).hexdigest() + '.json')
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+        if cached['key'] == key:
+            return cached['params']
+    except (OSError, ValueError, KeyError):
+        pass
+    proc = _run(cmd + [help_flag], stdin=DEVNULL, timeout=timeout)
+    schema = _parse_help(proc.stdout + proc.stderr)
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp, 'w') as f:
+            json.dump({'key': key, 'params': schema}, f)
+        os.replace(tmp, path)
+    except OSError:
+        # the cache dir is not writable; use the schema without caching it
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+    return schema
+
+
+def from_help(name, cmd=None, help_flag='--help', version='', url='', threads=None,
+              defaults=False, cache_dir=None, timeout=60):
+    '''dumpling factory with the parameters parsed from the help of the command.
+
+    The command is run with the help flag and its options and positional
+    arguments are parsed into :class:`.OptionParam` and
+    :class:`.ArgmntParam` definitions. The parsed schema is cached on
+    disk, so the command is not run again until the executable changes.
+    It is also available as ``dumpling_factory.from_help``.
+
+    Parameters
+    ----------
+    name : str
+        The name of the class returned.
+    cmd : str or list of str, optional
+        The command or a list of command and its nested subcommand(s).
+        Default is `name`.
+    help_flag : str
+        The flag to print the help message.
+    version, url, threads
+        The same as in :func:`.dumpling_factory`.
+    defaults : bool
+        Set the options to the default values found in the help. By
+        default all the options are off.
+    cache_dir : str, optional
+        The directory to cache the schema. Default is ``dumpling`` in the
+        user cache dir (``$XDG_CACHE_HOME`` or ``~/.cache``).
+    timeout : float
+        The seconds to wait for the help message.
+
+    Returns
+    -------
+    class
+        a class object
+
+    Examples
+    --------
+    >>> import os
+    >>> from dumpling import from_help
+    >>> from tempfile import mkdtemp
+    >>> from shutil import rmtree
+    >>> tmpd = mkdtemp()
+    >>> tool = os.path.join(tmpd, 'tool')
+    >>> with open(tool, 'w') as f:
+    ...     _ = f.write('#!/bin/sh\\n'
+    ...                 'if [ "$1" = --help ]; then\\n'
+    ...                 '  echo "usage: tool [--cpu N] <input>"\\n'
+    ...                 '  echo "  --cpu N  number of CPUs (default: 1)"\\n'
+    ...                 'else echo "$@"; fi\\n')
+    >>> os.chmod(tool, 0o755)
+    >>> Tool = from_help('tool', tool, cache_dir=tmpd)
+    >>> p = Tool()
+    >>> p.params['cpu'].help
+    'number of CPUs (default: 1)'
+    >>> p.update(cpu=4, input='a.fa')
+    >>> p().stdout
+    '--cpu 4 a.fa\\n'
+    >>> rmtree(tmpd)
+    '''
+    if cmd is None:
+        cmd = name
+    if isinstance(cmd, str):
+        cmd = [cmd]
+    params = []
+    names = set()
+    for p in _help_schema(list(cmd), help_flag, version, cache_dir, timeout):
+        try:
+            if p['type'] == 'option':
+                param = OptionParam(p['flag'], p['alter'], help=p['help'],
+                                    delimiter=p['delimiter'])
+                if defaults and p['default'] is not None:
+                    param.value = p['default']
+            else:
+                param = ArgmntParam(p['name'], help=p['help'])
+        except ValueError:
+            # the flag can not be converted to a legal name, e.g. '-1'
+            continue
+        if param.name not in names:
+            names.add(param.name)
+            params.append(param)
+    return dumpling_factory(name, cmd, Parameters(*params), version, url, threads)
+
+
+dumpling_factory.from_help = from_help
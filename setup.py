@@ -19,7 +19,7 @@ classifiers = [
     'Topic :: Software Development :: Libraries',
     'Programming Language :: Python',
     'Programming Language :: Python :: 3',
-    'Programming Language :: Python :: 3.5',
+    'Programming Language :: Python :: 3.9',
     'Operating System :: Unix',
     'Operating System :: POSIX',
     'Operating System :: Microsoft',
@@ -44,6 +44,7 @@ setup(name='dumpling',
       url='http://github.com/rnaer/dumpling',
       py_modules=["dumpling"],
       test_suite='nose.collector',
+      python_requires='>=3.9',
       install_requires=[],
       extras_require={'test': ["nose", "pep8", "flake8"],
                       'coverage': ["coverage"],
@@ -1,15 +1,28 @@
-from unittest import TestCase, main
+from unittest import TestCase, main, skipUnless
+from unittest.mock import patch
 from tempfile import mkdtemp
 from collections import namedtuple
+from itertools import product
 from shutil import rmtree
 from os.path import join, realpath
-from subprocess import DEVNULL, CalledProcessError
+from subprocess import DEVNULL, CalledProcessError, TimeoutExpired
+from io import BytesIO
+import asyncio
+import json
+import mmap
 import os
+import signal
 import stat
+import subprocess
+import sys
+import threading
+import time
 
 from dumpling import (
-    ArgmntParam, OptionParam, Parameters, dumpling_factory,
-    check_choice, check_range)
+    ArgmntParam, ArgmntListParam, OptionParam, Parameters, dumpling_factory,
+    check_choice, check_range, BatchRunner, ProcessStream, ResultCache, PipeInput, Pipeline,
+    SlotScheduler, ResourceUsage, CancelHandle, ProcessCancelled, SingleFlight, SpooledOutput,
+    RetryPolicy, JSONLinesTrace, ChromeTrace, BatchJournal)
 
 
 class CheckTests(TestCase):
@@ -52,6 +65,14 @@ class ArgmntParamTests(Tests):
         exp = "ArgmntParam(name='out', value='output.txt', action=<lambda>, help='')"
         self.assertEqual(repr(self.tests[-1]), exp)
 
+    def test_io(self):
+        p = ArgmntParam('out', 'output.txt', io='out')
+        self.assertEqual(p.io, 'out')
+        exp = "ArgmntParam(name='out', value='output.txt', action=<lambda>, help='', io='out')"
+        self.assertEqual(repr(p), exp)
+        with self.assertRaises(ValueError):
+            ArgmntParam('out', io='output')
+
     def test_get_arg(self):
         p = self.tests[-1]
         exp = [p.value]
@@ -60,6 +81,52 @@ class ArgmntParamTests(Tests):
         self.assertEqual(p._get_arg(), [])
 
 
+class ArgmntListParamTests(TestCase):
+    def test_value(self):
+        p = ArgmntListParam('files', ['a', 'b'], action=str.upper)
+        self.assertEqual(p.value, ('A', 'B'))
+        self.assertEqual(p._get_arg(), ['A', 'B'])
+        p.value = 'c'
+        self.assertEqual(p._get_arg(), ['C'])
+        p.value = []
+        self.assertTrue(p.is_on())
+        self.assertEqual(str(p), '')
+        p.off()
+        self.assertEqual(p._get_arg(), [])
+
+    def test_action(self):
+        with self.assertRaises(ValueError):
+            ArgmntListParam('n', [1, 20], action=check_range(0, 10))
+
+    def test_command(self):
+        App = dumpling_factory('ls', 'ls', Parameters(OptionParam('-l'), ArgmntListParam('files')))
+        app = App()
+        app.update(l=True, files=(str(i) for i in range(3)))
+        self.assertEqual(app.command, ['ls', '-l', '0', '1', '2'])
+
+    def test_io(self):
+        tmpd = mkdtemp()
+        self.addCleanup(rmtree, tmpd)
+        srcs = [join(tmpd, i) for i in 'ab']
+        dst = join(tmpd, 'out')
+        App = dumpling_factory(
+            'cat', ['sh', '-c', 'cat "$@" > $0'],
+            Parameters(ArgmntParam('dst', io='out'), ArgmntListParam('srcs', io='in')))
+        app = App()
+        app.update(dst=dst, srcs=srcs)
+        self.assertEqual(app.params.paths('in'), srcs)
+        for src in srcs:
+            with open(src, 'w') as f:
+                f.write(src)
+        self.assertFalse(app.up_to_date())
+        app()
+        self.assertTrue(app.up_to_date())
+        cache = ResultCache(join(tmpd, 'cache'))
+        self.assertIsNotNone(cache.key(app))
+        with open(dst) as f:
+            self.assertEqual(f.read(), ''.join(srcs))
+
+
 class OptionParamTests(Tests):
     def test_init(self):
         attrs = ['flag', 'name', 'value', 'help']
@@ -119,6 +186,44 @@ class OptionParamTests(Tests):
         b = OptionParam(flag='-i', name='i')
         self.assertNotEqual(a, b)
 
+    def test_slots(self):
+        p = self.tests[1]
+        self.assertFalse(hasattr(p, '__dict__'))
+        with self.assertRaises(AttributeError):
+            p.spam = 1
+
+    def test_copy_shares_spec(self):
+        p = self.tests[2]
+        q = p._copy()
+        self.assertIs(p._spec, q._spec)
+        q.on('R1.fq')
+        self.assertEqual(p.value, False)
+        # changing the spec of a copy does not change the original
+        q.help = 'read 1'
+        q.delimiter = '='
+        self.assertEqual(p.help, 'Left-end read')
+        self.assertEqual(str(p.on('R.fq')), '-1 R.fq')
+        self.assertEqual(str(q), '-1=R1.fq')
+
+    def test_copy_mutable_value(self):
+        App = dumpling_factory('echo', 'echo', Parameters(ArgmntParam('x', [1])))
+        a1, a2 = App(), App()
+        a1.params['x'].value.append(2)
+        self.assertEqual(a1.command, ['echo', '[1, 2]'])
+        self.assertEqual(a2.params['x'].value, [1])
+        self.assertEqual(a2.command, ['echo', '[1]'])
+        self.assertEqual(App().params['x'].value, [1])
+
+    def test_copy_subclass_attrs(self):
+        class MyParam(ArgmntParam):
+            def __init__(self, name, value=None, extra=None):
+                super().__init__(name, value)
+                self.extra = extra
+
+        params = Parameters(MyParam('x', 'v', extra=5))
+        self.assertEqual(params['x'].extra, 5)
+        self.assertEqual(params.copy()['x'].extra, 5)
+
     def test_get_args(self):
         p = self.tests[1]
         exp = ['-e', '0.1']
@@ -172,6 +277,54 @@ class ParametersTests(Tests):
         for k in self.params:
             self.assertTrue(self.params[k].value is None)
 
+    def test_copy(self):
+        params = self.params.copy()
+        self.assertEqual(params, self.params)
+        params['e'] = 5
+        p = params['db']
+        p.on('db.txt')
+        self.assertEqual(self.params['e'].value, 0.1)
+        self.assertEqual(self.params['db'].value, 'file path')
+        # the changes made before copying are kept
+        new = params.copy()
+        self.assertEqual(new['e'].value, 5)
+        self.assertEqual(new['db'].value, 'db.txt')
+        # but the params are not shared afterwards
+        p.on('new.txt')
+        self.assertEqual(new['db'].value, 'db.txt')
+        new.off()
+        self.assertEqual(params['e'].value, 5)
+
+    def test_init_raise(self):
+        with self.assertRaises(ValueError):
+            Parameters(OptionParam('-i'), 'input')
+
+    def test_sweep(self):
+        axes = {'out': ['a', 'b'], '--db': ['x', 'y', 'z'], 'e': [1, 2]}
+        obs = list(self.params.sweep(**axes))
+        self.assertEqual(len(obs), 12)
+        self.assertEqual(obs[0], ['--db', 'x', '-e', '1', 'a'])
+        self.assertEqual(obs[-1], ['--db', 'z', '-e', '2', 'b'])
+        # the same as setting each combination
+        for args, (out, db, e) in zip(obs, product(*axes.values())):
+            params = self.params.copy()
+            params.update(out=out, db=db, e=e)
+            self.assertEqual(args, params._argv())
+        # the params are not changed
+        self.assertEqual(self.params['e'].value, 0.1)
+
+    def test_sweep_lazy(self):
+        sweep = self.params.sweep(e=range(1000), out=range(1000), r1=range(1000))
+        self.assertEqual(next(sweep), ['--db', 'file path', '-e', '0', '-1', '0', '0'])
+
+    def test_sweep_raise(self):
+        with self.assertRaises(ValueError):
+            self.params.sweep(e=[1, -1])
+        with self.assertRaises(ValueError):
+            self.params.sweep(xxx=[1])
+        with self.assertRaises(ValueError):
+            self.params.sweep(r1=[1], **{'-1': [2]})
+
     def test_update(self):
         kv = {'db': 'db.txt',
               'e': 3}
@@ -202,6 +355,80 @@ class DumplingTests(Tests):
         self.assertEqual(app.params, self.params)
         self.assertEqual(app.cmd, [self.cmd])
 
+    def test_instances(self):
+        app1, app2 = self.TestApp(), self.TestApp()
+        app1.update(e=3)
+        app2.params['db'].on('other.db')
+        self.assertEqual(app1.params['db'].value, 'file path')
+        self.assertEqual(app2.params['e'].value, 0.1)
+        # the params given to the factory are not changed either
+        self.assertEqual(self.params['e'].value, 0.1)
+        self.assertEqual(self.TestApp().command, [self.cmd, '--db', 'file path', '-e', '0.1', 'output.txt'])
+
+    def test_command_cache(self):
+        app = self.TestApp()
+        exp = [self.cmd, '--db', 'file path', '-e', '0.1', 'output.txt']
+        self.assertEqual(app.command, exp)
+        self.assertIsNotNone(app.params._compiled)
+        # the returned list can be changed freely
+        app.command.append('spam')
+        self.assertEqual(app.command, exp)
+        app.update(e=3)
+        self.assertIsNone(app.params._compiled)
+        self.assertEqual(app.command, [self.cmd, '--db', 'file path', '-e', '3', 'output.txt'])
+        app.params.off()
+        self.assertEqual(app.command, [self.cmd])
+        # the params retrieved can be changed without telling the Parameters
+        p = app.params['r1']
+        app.command
+        p.on('R1.fq')
+        self.assertEqual(app.command, [self.cmd, '-1', 'R1.fq'])
+        p.delimiter = '='
+        self.assertEqual(str(app), '{} -1=R1.fq'.format(self.cmd))
+
+    def test_sweep(self):
+        app = self.TestApp()
+        obs = list(app.sweep(e=[1, 2]))
+        self.assertEqual(obs, [[self.cmd, '--db', 'file path', '-e', str(e), 'output.txt'] for e in (1, 2)])
+
+    def test_executable(self):
+        dirs = [mkdtemp() for _ in range(2)]
+        for d in dirs:
+            self.addCleanup(rmtree, d)
+            with open(join(d, 'tool'), 'w') as f:
+                f.write('#!/bin/sh\necho {}\n'.format(d))
+            os.chmod(join(d, 'tool'), stat.S_IXUSR | stat.S_IRUSR)
+        app = dumpling_factory('tool', 'tool', Parameters())()
+        with patch.dict(os.environ, PATH=dirs[0]):
+            self.assertEqual(app.executable, join(dirs[0], 'tool'))
+            self.assertEqual(app().stdout, dirs[0] + '\n')
+            self.assertEqual(app.command, ['tool'])
+        # the cache is invalidated by a new PATH
+        with patch.dict(os.environ, PATH=os.pathsep.join(dirs[::-1])):
+            self.assertEqual(app().stdout, dirs[1] + '\n')
+        with patch.dict(os.environ, PATH=dirs[0]):
+            # or by a removed executable
+            os.remove(join(dirs[0], 'tool'))
+            self.assertEqual(app.executable, 'tool')
+            with self.assertRaises(FileNotFoundError):
+                app()
+
+    def test_command_pipe_input(self):
+        app = self.TestApp()
+        app.update(out=PipeInput('spam'))
+        self.assertEqual(app.command[-1], '/dev/fd/N')
+        pipes = app._open_pipes()
+        self.assertEqual(app.command[-1], '/dev/fd/{}'.format(pipes[0].fd))
+        pipes[0]._close()
+
+    def test_copy(self):
+        app = self.TestApp()
+        app.update(e=3)
+        new = app.copy()
+        new.update(r1='R1.fq')
+        self.assertEqual(new.params['e'].value, 3)
+        self.assertTrue(app.params['r1'].is_off())
+
     def test_repr(self):
         exp = ('''test.py
 -------
@@ -262,6 +489,1285 @@ test.py: error: the following arguments are required: -1
             self.assertEqual(e.stdout, stdout.format(realpath(self.tmpd)))
             self.assertEqual(e.stderr, stderr)
 
+    def test_run_async(self):
+        app = self.TestApp()
+        app.update(e=3, r1='R1.fq', out='output.txt')
+        p = asyncio.run(app.run_async())
+        out = 'directory: {}\nfile path\n3.0\nR1.fq\noutput.txt\n'.format(os.getcwd())
+        self.assertEqual(p.stdout, out)
+        self.assertEqual(p.stderr, '')
+        self.assertEqual(p.returncode, 0)
+        self.assertEqual(p.args, app.command)
+
+    def test_run_async_fail(self):
+        app = self.TestApp()
+        with self.assertRaises(CalledProcessError) as cm:
+            asyncio.run(app.run_async())
+        self.assertIn('required', cm.exception.stderr)
+        p = asyncio.run(app.run_async(stdout=DEVNULL, check=False))
+        self.assertEqual(p.stdout, None)
+        self.assertNotEqual(p.returncode, 0)
+
+    def test_run_async_gather(self):
+        apps = []
+        for out in ['a', 'b', 'c']:
+            app = self.TestApp()
+            app.update(e=3, r1='R1.fq', out=out)
+            apps.append(app)
+
+        async def gather():
+            return await asyncio.gather(*[app.run_async() for app in apps])
+        procs = asyncio.run(gather())
+        self.assertEqual([p.stdout.split()[-1] for p in procs], ['a', 'b', 'c'])
+
+    def tearDown(self):
+        rmtree(self.tmpd)
+
+
+class BatchRunnerTests(TestCase):
+    def setUp(self):
+        # sleep for the given seconds and then print it
+        self.App = dumpling_factory(
+            'sleep', ['sh', '-c', 'sleep $0 && echo $0'], Parameters(ArgmntParam('t')))
+
+    def test_map_ordered(self):
+        app = self.App()
+        ts = ['0.3', '0', '0.1']
+        obs = [p.stdout for p in app.map([{'t': t} for t in ts], max_workers=3)]
+        self.assertEqual(obs, [t + '\n' for t in ts])
+        # the app itself is not changed
+        self.assertTrue(app.params['t'].is_off())
+
+    def test_map_unordered(self):
+        app = self.App()
+        ts = ['0.3', '0', '0.1']
+        obs = [p.stdout for p in app.map([{'t': t} for t in ts], max_workers=3, ordered=False)]
+        self.assertEqual(obs, ['0\n', '0.1\n', '0.3\n'])
+
+    def test_map_raise(self):
+        app = self.App()
+        with self.assertRaises(CalledProcessError):
+            list(app.map([{'t': '0'}, {'t': 'x'}]))
+        procs = list(app.map([{'t': '0'}, {'t': 'x'}], check=False))
+        self.assertEqual(procs[0].returncode, 0)
+        self.assertNotEqual(procs[1].returncode, 0)
+
+    def test_shared_cap(self):
+        with BatchRunner(max_workers=1) as runner:
+            a = runner.submit(self.App(), {'t': '0.2'})
+            b = runner.submit(self.App(), {'t': '0'})
+            # b has to wait for a in the single worker
+            self.assertEqual(b.result().stdout, '0\n')
+            self.assertTrue(a.done())
+
+
+class SlotSchedulerTests(TestCase):
+    def setUp(self):
+        params = Parameters(OptionParam('--cpu', value=1), ArgmntParam('t', 0))
+        # sleep for the given seconds
+        self.App = dumpling_factory(
+            'sleep', ['sh', '-c', 'sleep $3', 'sleep'], params, threads='cpu')
+
+    def test_cpus(self):
+        app = self.App()
+        self.assertEqual(app.threads, 'cpu')
+        self.assertEqual(app.cpus(), 1)
+        app.update(cpu=8)
+        self.assertEqual(app.cpus(), 8)
+        app.params.off()
+        self.assertEqual(app.cpus(), 1)
+        self.assertEqual(dumpling_factory('true', 'true', Parameters())().cpus(), 1)
+        with self.assertRaises(KeyError):
+            dumpling_factory('true', 'true', Parameters(), threads='--cpu')
+
+    def test_slots(self):
+        used = []
+
+        class Scheduler(SlotScheduler):
+            def _dispatch(self):
+                super()._dispatch()
+                used.append(self.slots - self._free_slots)
+
+        cpus = [4, 1, 1, 2, 3, 1, 8]
+        with Scheduler(slots=4) as scheduler:
+            procs = list(scheduler.map(self.App(), [{'cpu': c, 't': 0.05} for c in cpus]))
+        self.assertEqual([p.returncode for p in procs], [0] * len(cpus))
+        self.assertEqual(max(used), 4)
+        self.assertEqual(used[-1], 0)
+
+    def test_backfill(self):
+        app = self.App()
+        with SlotScheduler(slots=4) as scheduler:
+            a = scheduler.submit(app, {'cpu': 3, 't': 0.3})
+            b = scheduler.submit(app, {'cpu': 2})
+            c = scheduler.submit(app, {'cpu': 1})
+            c.result()
+            self.assertFalse(b.done())
+            self.assertFalse(a.done())
+        self.assertTrue(b.done())
+
+    def test_no_starvation(self):
+        app = self.App()
+        finished = []
+        with SlotScheduler(slots=4) as scheduler:
+            cpus = [1] * 4 + [4] + [1] * 36
+            for i, c in enumerate(cpus):
+                future = scheduler.submit(app, {'cpu': c, 't': 0.02})
+                future.add_done_callback(lambda f, i=i: finished.append(i))
+        # the large job waits for at most 4 jobs behind it
+        self.assertLess(finished.index(4), 10)
+        with SlotScheduler(slots=4, max_skips=0) as scheduler:
+            a = scheduler.submit(app, {'cpu': 3, 't': 0.3})
+            b = scheduler.submit(app, {'cpu': 2})
+            c = scheduler.submit(app, {'cpu': 1})
+            time.sleep(0.1)
+            self.assertFalse(a.done())
+            self.assertFalse(b.done())
+            self.assertFalse(c.done())
+
+    def test_memory(self):
+        app = self.App()
+        with SlotScheduler(slots=4, memory=10) as scheduler:
+            a = scheduler.submit(app, {'t': 0.3}, memory=6)
+            b = scheduler.submit(app, {}, memory=6)
+            b.result()
+            self.assertTrue(a.done())
+
+    def test_shutdown_cancel(self):
+        app = self.App()
+        scheduler = SlotScheduler(slots=1)
+        a = scheduler.submit(app, {'t': 0.2})
+        b = scheduler.submit(app, {})
+        scheduler.shutdown(wait=False)
+        self.assertTrue(b.cancelled())
+        self.assertEqual(a.result().returncode, 0)
+
+
+class BatchJournalTests(TestCase):
+    def setUp(self):
+        self.tmpd = mkdtemp()
+        self.path = join(self.tmpd, 'batch.jsonl')
+        self.log = join(self.tmpd, 'log')
+        # log each run; fail on the message 'x'
+        script = 'echo $0 >> {} && [ $0 != x ] && echo $0'.format(self.log)
+        self.App = dumpling_factory('sh', ['sh', '-c', script],
+                                    Parameters(ArgmntParam('msg'), ArgmntParam('src', io='in')))
+
+    def tearDown(self):
+        rmtree(self.tmpd)
+
+    def runs(self):
+        with open(self.log) as f:
+            return f.read().split()
+
+    def test_resume(self):
+        kwargs_list = [{'msg': m} for m in 'abxc']
+        with BatchJournal(self.path) as journal:
+            procs = list(self.App().map(kwargs_list, check=False, journal=journal))
+        self.assertEqual([p.returncode for p in procs], [0, 0, 1, 0])
+        with BatchJournal(self.path) as journal:
+            self.assertEqual(len(journal), 3)
+            procs = list(self.App().map(kwargs_list, check=False, journal=journal))
+        # the failed run is repeated
+        self.assertEqual(sorted(self.runs()), ['a', 'b', 'c', 'x', 'x'])
+        self.assertEqual([p.stdout for p in procs], [None, None, '', None])
+        self.assertIsNone(procs[0].usage)
+        self.assertEqual(procs[0].args[-1], 'a')
+        with open(self.path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([r['status'] for r in records].count('failed'), 2)
+        self.assertEqual(len(records), 5)
+
+    def test_truncated(self):
+        with BatchJournal(self.path) as journal:
+            list(self.App().map([{'msg': 'a'}], journal=journal))
+        with open(self.path, 'a') as f:
+            f.write('{"key": "trunc')
+        with BatchJournal(self.path) as journal:
+            self.assertEqual(len(journal), 1)
+            list(self.App().map([{'msg': 'a'}, {'msg': 'b'}], journal=journal))
+        with BatchJournal(self.path) as journal:
+            self.assertEqual(len(journal), 2)
+        self.assertEqual(self.runs(), ['a', 'b'])
+
+    def test_input(self):
+        src = join(self.tmpd, 'in.txt')
+        with open(src, 'w') as f:
+            f.write('1')
+        app = self.App()
+        app.update(msg='a', src=src)
+        with BatchJournal(self.path) as journal:
+            key = journal.key(app)
+            self.assertEqual(key, journal.key(app))
+            self.assertNotEqual(key, journal.key(app, input='b'))
+            self.assertIsNone(journal.key(app, input=iter([b'b'])))
+            os.utime(src, ns=(0, 0))
+            self.assertNotEqual(key, journal.key(app))
+            os.remove(src)
+            self.assertIsNone(journal.key(app))
+
+    def test_check(self):
+        with BatchJournal(self.path) as journal:
+            with self.assertRaises(CalledProcessError):
+                list(self.App().map([{'msg': 'x'}], journal=journal))
+        with open(self.path) as f:
+            record = json.loads(f.readline())
+        self.assertEqual((record['status'], record['returncode']), ('failed', 1))
+
+    def test_pipe_input(self):
+        App = dumpling_factory('cat', 'cat', Parameters(ArgmntParam('file')))
+        kwargs_list = [{'file': PipeInput(b'AAA\n')}]
+        with BatchJournal(self.path) as journal:
+            list(App().map(kwargs_list, journal=journal))
+            procs = list(App().map([{'file': PipeInput(b'BBB\n')}], journal=journal))
+        self.assertEqual(procs[0].stdout, 'BBB\n')
+
+    def test_cwd(self):
+        dirs = []
+        for i, text in enumerate(['ham', 'eggs']):
+            d = join(self.tmpd, str(i))
+            os.mkdir(d)
+            with open(join(d, 'src'), 'w') as f:
+                f.write(text)
+            dirs.append(d)
+        procs = []
+        with BatchJournal(self.path) as journal:
+            for d in dirs + dirs:
+                procs += self.App().map([{'msg': 'a', 'src': 'src'}], cwd=d, journal=journal)
+            self.assertEqual(len(journal), 2)
+        self.assertEqual([p.stdout for p in procs], ['a\n', 'a\n', None, None])
+
+    def test_scheduler(self):
+        with BatchJournal(self.path) as journal:
+            with SlotScheduler(slots=2) as scheduler:
+                list(scheduler.map(self.App(), [{'msg': 'a'}], journal=journal))
+            with SlotScheduler(slots=2) as scheduler:
+                procs = list(scheduler.map(self.App(), [{'msg': 'a'}, {'msg': 'b'}],
+                                           journal=journal))
+        self.assertEqual([p.stdout for p in procs], [None, 'b\n'])
+        self.assertEqual(self.runs(), ['a', 'b'])
+
+
+class ProcessStreamTests(TestCase):
+    def setUp(self):
+        self.App = dumpling_factory(
+            'seq', ['sh', '-c', 'seq $0; echo done >&2; exit $1'],
+            Parameters(ArgmntParam('n'), ArgmntParam('code', 0)))
+
+    def test_lines(self):
+        app = self.App()
+        app.update(n=3)
+        with app.stream() as s:
+            self.assertEqual(list(s), ['1\n', '2\n', '3\n'])
+        self.assertEqual(s.returncode, 0)
+        self.assertEqual(s.stderr, 'done\n')
+
+    def test_chunks(self):
+        app = self.App()
+        app.update(n=1000)
+        with app.stream(text=False, chunk_size=100) as s:
+            chunks = list(s)
+        self.assertTrue(all(isinstance(c, bytes) and len(c) <= 100 for c in chunks))
+        self.assertEqual(b''.join(chunks).split(), [str(i).encode() for i in range(1, 1001)])
+
+    def test_check(self):
+        app = self.App()
+        app.update(n=2, code=3)
+        lines = []
+        with self.assertRaises(CalledProcessError) as cm:
+            with app.stream() as s:
+                for line in s:
+                    lines.append(line)
+        self.assertEqual(lines, ['1\n', '2\n'])
+        self.assertEqual(cm.exception.returncode, 3)
+        self.assertEqual(cm.exception.stderr, 'done\n')
+
+    def test_stop_early(self):
+        with ProcessStream(['yes']) as s:
+            for i, line in enumerate(s):
+                if i == 3:
+                    break
+        self.assertNotEqual(s.returncode, 0)
+
+
+class InputTests(TestCase):
+    def setUp(self):
+        self.Cat = dumpling_factory('cat', 'cat', Parameters(ArgmntParam('file')))
+
+    def test_input(self):
+        app = self.Cat()
+        tests = [b'spam\n', 'spam\n', BytesIO(b'spam\n'), (i for i in ['sp', b'am\n'])]
+        for test in tests:
+            self.assertEqual(app(input=test).stdout, 'spam\n')
+
+    def test_input_large(self):
+        # larger than the pipe buffer in both directions
+        chunks = (b'x' * 1000 + b'\n' for _ in range(10000))
+        p = self.Cat()(input=chunks)
+        self.assertEqual(len(p.stdout), 10010000)
+
+    def test_input_raise(self):
+        with self.assertRaises(ValueError):
+            self.Cat()(stdin=DEVNULL, input='spam')
+
+        def chunks():
+            yield 'spam'
+            raise RuntimeError('broken input')
+        with self.assertRaises(RuntimeError):
+            self.Cat()(input=chunks())
+
+    def test_stream_input(self):
+        with self.Cat().stream(input=['a\n', 'b\n']) as s:
+            self.assertEqual(list(s), ['a\n', 'b\n'])
+
+    def test_pipe_input(self):
+        app = self.Cat()
+        app.update(file=PipeInput('spam\n'))
+        self.assertEqual(str(app.params['file']), '/dev/fd/N')
+        p = app()
+        self.assertEqual(p.stdout, 'spam\n')
+        self.assertTrue(p.args[-1].startswith('/dev/fd/'))
+
+    def test_pipe_input_option(self):
+        App = dumpling_factory('paste', 'paste', Parameters(
+            OptionParam('-d', value=','), ArgmntParam('a'), ArgmntParam('b')))
+        app = App()
+        app.update(a=PipeInput('1\n2\n'), b=PipeInput(BytesIO(b'3\n4\n')))
+        self.assertEqual(app().stdout, '1,3\n2,4\n')
+        app.update(a=PipeInput('5\n'), b=PipeInput('6\n'))
+        with app.stream() as s:
+            self.assertEqual(list(s), ['5,6\n'])
+
+    def test_pipe_input_async(self):
+        app = self.Cat()
+        app.update(file=PipeInput(b'x' * 1000 + b'\n' for _ in range(1000)))
+        p = asyncio.run(app.run_async())
+        self.assertEqual(len(p.stdout), 1001000)
+        self.assertTrue(p.args[-1].startswith('/dev/fd/'))
+        self.assertNotEqual(p.args[-1], '/dev/fd/N')
+
+
+class PipelineTests(TestCase):
+    def setUp(self):
+        self.Cat = dumpling_factory('cat', 'cat', Parameters(ArgmntParam('file')))
+        self.Sh = dumpling_factory('sh', ['sh', '-c'], Parameters(ArgmntParam('script')))
+
+    def sh(self, script):
+        app = self.Sh()
+        app.update(script=script)
+        return app
+
+    def test_or(self):
+        a, b, c = self.Cat(), self.Cat(), self.Cat()
+        p = a | b
+        self.assertIsInstance(p, Pipeline)
+        self.assertEqual(p.apps, [a, b])
+        self.assertEqual((p | c).apps, [a, b, c])
+        self.assertEqual((c | p).apps, [c, a, b])
+        self.assertEqual((p | p).apps, [a, b, a, b])
+        self.assertEqual(p.command, [['cat'], ['cat']])
+
+    def test_call(self):
+        p = self.Cat() | self.sh('tr a-z A-Z') | self.sh('rev; echo err >&2')
+        proc = p(input=['spam\n', 'ham\n'])
+        self.assertEqual(proc.stdout, 'MAPS\nMAH\n')
+        self.assertEqual(proc.stderr, 'err\n')
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual([s.stderr for s in proc.stages], ['', '', 'err\n'])
+
+    def test_returncodes(self):
+        p = self.sh('echo a; exit 3') | self.sh('cat; exit 4') | self.Cat()
+        with self.assertRaises(CalledProcessError) as cm:
+            p()
+        self.assertEqual(cm.exception.returncode, 4)
+        proc = p(check=False)
+        self.assertEqual([s.returncode for s in proc.stages], [3, 4, 0])
+        self.assertEqual(proc.stdout, 'a\n')
+
+    def test_early_exit(self):
+        proc = (self.sh('yes') | self.sh('head -n 2'))(check=False)
+        self.assertEqual(proc.stdout, 'y\ny\n')
+        # the upstream is killed by SIGPIPE
+        self.assertNotEqual(proc.stages[0].returncode, 0)
+        self.assertEqual(proc.stages[1].returncode, 0)
+
+    def test_stdout_path(self):
+        tmpd = mkdtemp()
+        try:
+            out = join(tmpd, 'out')
+            proc = (self.Cat() | self.Cat())(input='spam', stdout=out, stderr=DEVNULL)
+            self.assertIsNone(proc.stdout)
+            self.assertIsNone(proc.stderr)
+            with open(out) as f:
+                self.assertEqual(f.read(), 'spam')
+        finally:
+            rmtree(tmpd)
+
+
+class BinaryOutputTests(TestCase):
+    def setUp(self):
+        self.App = dumpling_factory('sh', ['sh', '-c'], Parameters(ArgmntParam('script')))
+
+    def test_bytes(self):
+        app = self.App()
+        app.update(script=r"printf 'a\r\nb'; printf err >&2")
+        p = app(text=False)
+        self.assertEqual(p.stdout, b'a\r\nb')
+        self.assertEqual(p.stderr, b'err')
+        self.assertEqual(asyncio.run(app.run_async(text=False)).stdout, b'a\r\nb')
+
+    def test_bytearray(self):
+        app = self.App()
+        app.update(script='head -c 100000 /dev/zero')
+        buf = bytearray(10)
+        p = app(stdout=buf)
+        self.assertIs(p.stdout, buf)
+        self.assertEqual(buf, bytes(100000))
+
+    def test_memoryview(self):
+        app = self.App()
+        app.update(script='printf abc')
+        buf = bytearray(b'xxxxx')
+        p = app(stdout=memoryview(buf))
+        self.assertEqual(p.stdout, b'abc')
+        self.assertEqual(buf, b'abcxx')
+
+    def test_mmap(self):
+        app = self.App()
+        app.update(script='printf abc')
+        with mmap.mmap(-1, 10) as buf:
+            p = app(stdout=buf, stderr=DEVNULL)
+            self.assertEqual(p.stdout.tobytes(), b'abc')
+            p.stdout.release()
+
+    def test_overflow(self):
+        app = self.App()
+        app.update(script='head -c 100000 /dev/zero')
+        with self.assertRaises(BufferError):
+            app(stdout=memoryview(bytearray(10)))
+
+
+class SpooledOutputTests(TestCase):
+    def setUp(self):
+        self.App = dumpling_factory('sh', ['sh', '-c'], Parameters(ArgmntParam('script')))
+
+    def test_memory(self):
+        app = self.App()
+        app.update(script=r"printf 'a\r\nb'")
+        with SpooledOutput(100) as out:
+            p = app(stdout=out)
+            self.assertIs(p.stdout, out)
+            self.assertFalse(out.spilled)
+            self.assertIsNone(out.name)
+            self.assertEqual(len(out), 4)
+            self.assertEqual(out.read(), b'a\r\nb')
+            self.assertEqual(out.view(), b'a\r\nb')
+            with out.open(text=True) as f:
+                self.assertEqual(f.read(), 'a\nb')
+
+    def test_spill(self):
+        app = self.App()
+        app.update(script='head -c 300000 /dev/zero; echo err >&2')
+        tmpd = mkdtemp()
+        self.addCleanup(rmtree, tmpd)
+        out, err = SpooledOutput(1000, dir=tmpd), SpooledOutput(1000)
+        app(stdout=out, stderr=err)
+        self.assertTrue(out.spilled)
+        self.assertFalse(err.spilled)
+        self.assertEqual(err.read(), b'err\n')
+        self.assertEqual(os.path.dirname(out.name), tmpd)
+        self.assertEqual(len(out), 300000)
+        self.assertEqual(out.read(), bytes(300000))
+        self.assertEqual(len(out.view()), 300000)
+        # a new run replaces the output
+        app.update(script='echo a')
+        app(stdout=out)
+        self.assertFalse(out.spilled)
+        self.assertEqual(os.listdir(tmpd), [])
+        out.close()
+        self.assertEqual(out.read(), b'')
+
+
+class TraceTests(TestCase):
+    def setUp(self):
+        self.events = []
+        self.App = dumpling_factory('sh', ['sh', '-c'], Parameters(ArgmntParam('script')),
+                                    hooks=[self.events.append])
+        self.tmpd = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.tmpd)
+
+    def test_events(self):
+        app = self.App()
+        app.update(script='sleep 0.1; echo a; exit 3')
+        app(check=False)
+        names = ['start', 'pre_spawn', 'post_spawn', 'first_byte', 'exit', 'end']
+        self.assertEqual([e.event for e in self.events], names)
+        self.assertEqual(len({e.run for e in self.events}), 1)
+        times = [e.time for e in self.events]
+        self.assertEqual(times, sorted(times))
+        self.assertGreaterEqual(times[3] - times[2], 10 ** 8)
+        self.assertIsNone(self.events[0].args)
+        self.assertEqual(self.events[1].args, app.command)
+        self.assertIsNone(self.events[1].pid)
+        self.assertEqual(len({e.pid for e in self.events[2:5]}), 1)
+        self.assertEqual([e.returncode for e in self.events[-2:]], [3, 3])
+        self.assertEqual({e.app for e in self.events}, {'sh'})
+
+    def test_error(self):
+        app = self.App()
+        app.update(script='exit 1')
+        with self.assertRaises(CalledProcessError):
+            app()
+        self.assertEqual(self.events[-1].event, 'end')
+        self.assertIsNone(self.events[-1].returncode)
+        self.assertNotIn('first_byte', [e.event for e in self.events])
+
+    def test_exit_hook_error(self):
+        def hook(e):
+            if e.event == 'exit':
+                raise RuntimeError('broken hook')
+        app = self.App()
+        app.hooks = [hook]
+        app.update(script='true')
+        with patch('dumpling._killpg') as killpg:
+            with self.assertRaises(RuntimeError):
+                app()
+        killpg.assert_not_called()
+
+    def test_instance_hooks(self):
+        events = []
+        app = self.App()
+        app.hooks = [events.append]
+        app.update(script='true')
+        app()
+        self.assertEqual(self.events, [])
+        self.assertEqual(len(events), 5)
+
+    def test_jsonl(self):
+        path = join(self.tmpd, 'trace.jsonl')
+        app = self.App()
+        app.update(script='echo a')
+        with JSONLinesTrace(path) as trace:
+            app.hooks = [trace]
+            list(app.map([{}] * 3, max_workers=3))
+        with open(path) as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual(len(events), 18)
+        self.assertEqual(len({e['run'] for e in events}), 3)
+        self.assertEqual(events[0]['args'], None)
+
+    def test_chrome(self):
+        path = join(self.tmpd, 'trace.json')
+        app = self.App()
+        app.update(script='echo a')
+        with ChromeTrace(path) as trace:
+            app.hooks = [trace]
+            app()
+            app(stdout=DEVNULL)
+        with open(path) as f:
+            events = json.load(f)['traceEvents']
+        names = [e['name'] for e in events]
+        self.assertEqual(names, ['sh first_byte', 'sh render', 'sh spawn', 'sh run', 'sh decode',
+                                 'sh render', 'sh spawn', 'sh run', 'sh decode'])
+        for e in events:
+            if e['ph'] == 'X':
+                self.assertGreaterEqual(e['dur'], 0)
+
+
+class ResourceUsageTests(TestCase):
+    def setUp(self):
+        self.App = dumpling_factory('sh', ['sh', '-c'], Parameters(ArgmntParam('script')))
+
+    def test_usage(self):
+        app = self.App()
+        app.update(script='sleep 0.2; exit 2')
+        p = app(check=False)
+        self.assertEqual(p.returncode, 2)
+        self.assertIsInstance(p.usage, ResourceUsage)
+        self.assertGreaterEqual(p.usage.wall_time, 0.2)
+        self.assertGreaterEqual(p.usage.user_time, 0)
+        self.assertGreaterEqual(p.usage.sys_time, 0)
+        self.assertGreater(p.usage.max_rss, 0)
+
+    def test_signal(self):
+        app = self.App()
+        app.update(script='kill -9 $$')
+        p = app(check=False)
+        self.assertEqual(p.returncode, -9)
+
+    @skipUnless(os.path.exists('/proc/self/io'), 'requires /proc/<pid>/io')
+    def test_io(self):
+        app = self.App()
+        app.update(script='head -c 1000000 /dev/zero')
+        p = app(stdout=DEVNULL)
+        self.assertGreaterEqual(p.usage.read_bytes, 1000000)
+        self.assertGreaterEqual(p.usage.write_bytes, 1000000)
+
+
+class TimeoutTests(TestCase):
+    def setUp(self):
+        self.App = dumpling_factory('sh', ['sh', '-c'], Parameters(ArgmntParam('script')))
+
+    def test_timeout(self):
+        app = self.App()
+        # the grandchild keeps stdout open unless the whole group is killed
+        app.update(script='echo start; sleep 30 & sleep 30; wait')
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutExpired) as cm:
+            app(timeout=0.2)
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertEqual(cm.exception.timeout, 0.2)
+        self.assertEqual(cm.exception.stdout, 'start\n')
+
+    def test_no_timeout(self):
+        app = self.App()
+        app.update(script='echo a')
+        self.assertEqual(app(timeout=10).stdout, 'a\n')
+
+    def test_grace(self):
+        app = self.App()
+        app.update(script="trap '' TERM; sleep 1; echo done")
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutExpired):
+            app(timeout=0.1, grace=0.1)
+        self.assertLess(time.perf_counter() - start, 0.9)
+
+    def test_cancel(self):
+        handle = CancelHandle()
+        self.assertFalse(handle.cancelled)
+        app = self.App()
+        threading.Timer(0.2, handle.cancel).start()
+        with BatchRunner(3) as runner:
+            futures = [runner.submit(app, {'script': 'sleep 30'}, cancel=handle)
+                       for _ in range(3)]
+            for f in futures:
+                self.assertIsInstance(f.exception(10), ProcessCancelled)
+        self.assertTrue(handle.cancelled)
+        # a cancelled handle kills later runs immediately
+        app.update(script='sleep 30')
+        with self.assertRaises(ProcessCancelled):
+            app(cancel=handle)
+
+    def test_join_watchdog(self):
+        from dumpling import _Watchdog
+        with subprocess.Popen(['sleep', '30'], start_new_session=True) as proc:
+            watchdog = _Watchdog(proc, timeout=0.1, grace=1)
+            watchdog.join(10)
+            self.assertFalse(watchdog.is_alive())
+            self.assertEqual(watchdog.reason, 'timeout')
+            self.assertEqual(proc.wait(10), -signal.SIGTERM)
+
+    @skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+    def test_fork(self):
+        app = self.App()
+        app.update(script='sleep 30')
+        with BatchRunner(1) as runner:
+            future = runner.submit(app, {}, timeout=0.5)
+            time.sleep(0.1)
+            pid = os.fork()
+            if pid == 0:
+                # only the forking thread is left in the child
+                os._exit(0 if threading.active_count() == 1 else 1)
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(status, 0)
+            self.assertIsInstance(future.exception(10), TimeoutExpired)
+
+    def test_cancel_unused(self):
+        handle = CancelHandle()
+        app = self.App()
+        app.update(script='echo a')
+        self.assertEqual(app(cancel=handle).stdout, 'a\n')
+        self.assertEqual(handle._callbacks, set())
+        handle.cancel()
+
+
+class RetryTests(TestCase):
+    def setUp(self):
+        self.tmpd = mkdtemp()
+        self.count = join(self.tmpd, 'count')
+        # fail with 75 until the 3rd attempt
+        script = ('echo x >> {0}; n=$(wc -l < {0}); echo "attempt $n" >&2; '
+                  '[ $n -ge 3 ] || exit 75').format(self.count)
+        self.App = dumpling_factory('sh', ['sh', '-c', script], Parameters(),
+                                    retry=RetryPolicy(3, returncodes=[75], backoff=0.01))
+
+    def tearDown(self):
+        rmtree(self.tmpd)
+
+    def test_retry(self):
+        proc = self.App()()
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual([a.returncode for a in proc.attempts], [75, 75, 0])
+        self.assertEqual([a.stderr for a in proc.attempts],
+                         ['attempt 1\n', 'attempt 2\n', 'attempt 3\n'])
+        self.assertIs(proc.attempts[-1], proc)
+        for a in proc.attempts:
+            self.assertGreater(a.usage.wall_time, 0)
+
+    def test_exhausted(self):
+        with self.assertRaises(CalledProcessError):
+            self.App()(retry=RetryPolicy(2, returncodes=[75], backoff=0.01))
+        proc = self.App()(check=False, retry=False)
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual(len(proc.attempts), 1)
+
+    def test_not_transient(self):
+        proc = self.App()(check=False, retry=RetryPolicy(3, returncodes=[1], backoff=0.01))
+        self.assertEqual(proc.returncode, 75)
+        self.assertEqual(len(proc.attempts), 1)
+
+    def test_stderr(self):
+        app = self.App()
+        proc = app(check=False, retry=RetryPolicy(3, stderr='attempt [12]$', backoff=0.01))
+        self.assertEqual(len(proc.attempts), 3)
+        proc = app(check=False, retry=RetryPolicy(3, stderr='^busy', backoff=0.01))
+        self.assertEqual(len(proc.attempts), 1)
+
+    def test_captures(self):
+        retry = RetryPolicy(3, stderr='attempt [12]$', backoff=0.01)
+        with SpooledOutput(4) as err:
+            proc = self.App()(stderr=err, retry=retry)
+            self.assertIs(proc.stderr, err)
+            self.assertEqual(err.read(), b'attempt 3\n')
+            self.assertEqual([a.stderr.read() for a in proc.attempts[:-1]],
+                             [b'attempt 1\n', b'attempt 2\n'])
+        os.remove(self.count)
+        buf = memoryview(bytearray(100))
+        proc = self.App()(stderr=buf, retry=retry)
+        self.assertEqual(bytes(proc.stderr), b'attempt 3\n')
+        self.assertEqual([bytes(a.stderr) for a in proc.attempts],
+                         [b'attempt 1\n', b'attempt 2\n', b'attempt 3\n'])
+        self.assertEqual(bytes(buf[:10]), b'attempt 3\n')
+
+    def test_input(self):
+        # an iterator can not be fed again
+        proc = self.App()(check=False, input=iter([b'a']))
+        self.assertEqual(len(proc.attempts), 1)
+
+    def test_pipe_input(self):
+        App = dumpling_factory('cat', ['sh', '-c', 'cat $0; exit 75'],
+                               Parameters(ArgmntParam('file')))
+        app = App()
+        retry = RetryPolicy(3, backoff=0.01)
+        app.update(file=PipeInput(i for i in [b'gen\n']))
+        proc = app(check=False, retry=retry)
+        self.assertEqual([a.stdout for a in proc.attempts], ['gen\n'])
+        app.update(file=PipeInput(b'data\n'))
+        proc = app(check=False, retry=retry)
+        self.assertEqual([a.stdout for a in proc.attempts], ['data\n'] * 3)
+
+    def test_file_streams(self):
+        # the file objects are closed after the first attempt
+        with open(join(self.tmpd, 'err'), 'w') as err:
+            proc = self.App()(check=False, stderr=err)
+        self.assertEqual(proc.returncode, 75)
+        self.assertEqual(len(proc.attempts), 1)
+        proc = self.App()(stderr=join(self.tmpd, 'err'))
+        self.assertEqual(len(proc.attempts), 2)
+
+    def test_timeouts(self):
+        App = dumpling_factory('sleep', ['sleep', '5'], Parameters())
+        with self.assertRaises(TimeoutExpired):
+            App()(timeout=0.1, retry=RetryPolicy(2, backoff=0.01))
+        start = time.monotonic()
+        with self.assertRaises(TimeoutExpired):
+            App()(timeout=0.1, grace=0.1, retry=RetryPolicy(2, timeouts=True, backoff=0.01))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_cancel_backoff(self):
+        handle = CancelHandle()
+        threading.Timer(0.2, handle.cancel).start()
+        start = time.monotonic()
+        proc = self.App()(check=False, cancel=handle,
+                          retry=RetryPolicy(3, returncodes=[75], backoff=60, jitter=0))
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual([a.returncode for a in proc.attempts], [75])
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=1, factor=2, max_backoff=5, jitter=0)
+        self.assertEqual([policy.delay(i) for i in range(1, 5)], [1, 2, 4, 5])
+        policy = RetryPolicy(backoff=1, jitter=0.5)
+        for _ in range(10):
+            self.assertTrue(0.5 <= policy.delay(1) <= 1)
+        with self.assertRaises(ValueError):
+            RetryPolicy(0)
+        with self.assertRaises(ValueError):
+            RetryPolicy(jitter=2)
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        self.App = dumpling_factory(
+            'sh', ['sh', '-c'], Parameters(ArgmntParam('script')))
+        self.flight = SingleFlight()
+
+    def test_threads(self):
+        with BatchRunner(6) as runner:
+            kwargs = [{'script': 'sleep 0.3; echo $$'}] * 4 + [{'script': 'sleep 0.3; echo $$ 1'}] * 2
+            results = list(runner.map(self.App(), kwargs, flight=self.flight))
+        self.assertEqual(len({p.stdout for p in results[:4]}), 1)
+        self.assertEqual(len({p.stdout for p in results[4:]}), 1)
+        self.assertNotEqual(results[0].stdout.split()[0], results[4].stdout.split()[0])
+        self.assertEqual(len(self.flight), 0)
+
+    def test_key(self):
+        app = self.App()
+        app.update(script='echo')
+        key = self.flight.key(app)
+        self.assertEqual(key, self.flight.key(app.copy()))
+        self.assertNotEqual(key, self.flight.key(app, stdout=DEVNULL))
+        self.assertNotEqual(key, self.flight.key(app, cwd='/'))
+        self.assertIsNone(self.flight.key(app, input='a'))
+        self.assertIsNone(self.flight.key(app, stdin=BytesIO()))
+
+    def test_check(self):
+        app = self.App()
+        app.update(script='sleep 0.3; exit 1')
+        with BatchRunner(2) as runner:
+            f1 = runner.submit(app, {}, flight=self.flight)
+            f2 = runner.submit(app, {}, flight=self.flight, check=False)
+            self.assertIsInstance(f1.exception(), CalledProcessError)
+            self.assertEqual(f2.result().returncode, 1)
+
+    def test_async(self):
+        app = self.App()
+        app.update(script='sleep 0.3; echo $$')
+
+        async def main():
+            return await asyncio.gather(*[app.run_async(flight=self.flight) for _ in range(3)])
+
+        results = asyncio.run(main())
+        self.assertEqual(len({p.stdout for p in results}), 1)
+
+    def test_async_cancel_leader(self):
+        app = self.App()
+        app.update(script='sleep 0.3; echo $$')
+
+        async def main():
+            leader = asyncio.ensure_future(app.run_async(flight=self.flight))
+            await asyncio.sleep(0.1)
+            follower = asyncio.ensure_future(app.run_async(flight=self.flight))
+            await asyncio.sleep(0.1)
+            leader.cancel()
+            return await follower
+
+        self.assertTrue(asyncio.run(main()).stdout)
+        self.assertEqual(len(self.flight), 0)
+
+
+class XargsTests(TestCase):
+    def setUp(self):
+        self.App = dumpling_factory(
+            'count', ['sh', '-c', 'echo $#', 'sh'], Parameters(ArgmntListParam('files')))
+
+    def test_arg_max(self):
+        app = self.App()
+        items = ['{:020d}'.format(i) for i in range(300000)]
+        app.update(files=items)
+        proc = app.xargs('files', max_workers=2)
+        counts = [int(i) for i in proc.stdout.split()]
+        self.assertEqual(sum(counts), len(items))
+        self.assertGreater(len(counts), 2)
+        self.assertEqual([p.args[4:] for p in proc.batches][0], items[:counts[0]])
+
+    def test_order(self):
+        App = dumpling_factory('echo', 'echo', Parameters(ArgmntListParam('words')))
+        app = App()
+        app.update(words=range(10))
+        proc = app.xargs('words', max_workers=4)
+        self.assertEqual(proc.stdout, '0 1 2\n3 4 5\n6 7 8\n9\n')
+        self.assertEqual(len(proc.batches), 4)
+        self.assertEqual(app.params['words'].value, tuple(range(10)))
+
+    def test_limit(self):
+        app = self.App()
+        app.update(files=['a' * 10] * 10)
+        with patch('dumpling._arg_max', return_value=100):
+            proc = app.xargs('files', max_workers=1)
+        self.assertEqual(proc.stdout.split(), ['2'] * 5)
+
+    def test_output_file(self):
+        tmpd = mkdtemp()
+        self.addCleanup(rmtree, tmpd)
+        out = join(tmpd, 'out')
+        app = self.App()
+        app.update(files=range(5))
+        app.xargs('files', max_args=2, stdout=out)
+        with open(out) as f:
+            self.assertEqual(f.read(), '2\n2\n1\n')
+
+    def test_output_list(self):
+        tmpd = mkdtemp()
+        self.addCleanup(rmtree, tmpd)
+        outs = [join(tmpd, i, 'out') for i in 'ab']
+        for out in outs:
+            os.mkdir(os.path.dirname(out))
+        # write the words into both output files
+        App = dumpling_factory(
+            'tee', ['sh', '-c', 'a=$1 b=$2; shift 2; echo "$@" | tee $a $b > /dev/null', 'sh'],
+            Parameters(ArgmntListParam('outs', io='out'), ArgmntListParam('words')))
+        app = App()
+        app.update(outs=outs, words=list('xyz'))
+        app.xargs('words', max_args=1)
+        for out in outs:
+            with open(out) as f:
+                self.assertEqual(f.read(), 'x\ny\nz\n')
+
+    def test_not_list(self):
+        App = dumpling_factory('echo', 'echo', Parameters(ArgmntParam('word')))
+        app = App()
+        app.update(word='hello')
+        with self.assertRaises(TypeError):
+            app.xargs('word')
+
+    def test_fail(self):
+        App = dumpling_factory('sh', ['sh', '-c', 'exit 1'], Parameters(ArgmntListParam('x')))
+        app = App()
+        app.update(x=[1, 2])
+        with self.assertRaises(CalledProcessError):
+            app.xargs('x')
+        self.assertEqual(app.xargs('x', max_args=1, check=False).returncode, 1)
+
+
+class ScatterTests(TestCase):
+    def setUp(self):
+        self.tmpd = mkdtemp()
+        self.fasta = join(self.tmpd, 'seqs.fa')
+        with open(self.fasta, 'w') as f:
+            for i in range(10):
+                f.write('>s{0}\nACGT\nACGT\n'.format(i))
+        self.App = dumpling_factory(
+            'sh', ['sh', '-c', 'cat "$1" > "$0"; wc -l < "$1"'],
+            Parameters(ArgmntParam('out', io='out'), ArgmntParam('query', io='in')))
+
+    def tearDown(self):
+        rmtree(self.tmpd)
+
+    def test_fasta(self):
+        app = self.App()
+        app.update(query=self.fasta, out='out.fa')
+        proc = app.scatter('query', shards=3, cwd=self.tmpd, tmpdir=self.tmpd)
+        self.assertEqual(len(proc.shards), 3)
+        self.assertEqual(sum(int(i) for i in proc.stdout.split()), 30)
+        with open(self.fasta) as a, open(join(self.tmpd, 'out.fa')) as b:
+            self.assertEqual(a.read(), b.read())
+        # the shard files are removed
+        self.assertEqual(sorted(os.listdir(self.tmpd)), ['out.fa', 'seqs.fa'])
+
+    def test_lines(self):
+        with open(self.fasta, 'w') as f:
+            f.write('a\nb\nc\n')
+        app = self.App()
+        app.update(query=self.fasta, out=join(self.tmpd, 'out'))
+        stdout = join(self.tmpd, 'stdout')
+        proc = app.scatter('query', shards=10, stdout=stdout)
+        self.assertEqual(len(proc.shards), 3)
+        self.assertIsNone(proc.stdout)
+        with open(stdout) as f:
+            self.assertEqual(f.read().split(), ['1', '1', '1'])
+        with open(join(self.tmpd, 'out')) as f:
+            self.assertEqual(f.read(), 'a\nb\nc\n')
+
+    def test_merge(self):
+        def merge(paths, dst):
+            with open(dst, 'w') as f:
+                f.write(str(len(paths)))
+
+        app = self.App()
+        app.update(query=self.fasta, out=join(self.tmpd, 'out'))
+        app.scatter('query', shards=2, merge={'out': merge})
+        with open(join(self.tmpd, 'out')) as f:
+            self.assertEqual(f.read(), '2')
+
+    def test_buffers(self):
+        app = self.App()
+        app.update(query=self.fasta, out=join(self.tmpd, 'out'))
+        buf = bytearray(b'old')
+        proc = app.scatter('query', shards=4, stdout=buf)
+        self.assertIs(proc.stdout, buf)
+        self.assertEqual([int(i) for i in buf.split()], [9, 6, 9, 6])
+        proc = app.scatter('query', shards=4, stdout=memoryview(bytearray(100)))
+        self.assertEqual(bytes(proc.stdout), bytes(buf))
+        with self.assertRaises(BufferError):
+            app.scatter('query', shards=4, stdout=memoryview(bytearray(4)))
+
+    def test_spooled(self):
+        app = self.App()
+        app.update(query=self.fasta, out=join(self.tmpd, 'out'))
+        for max_size in (100, 4):
+            with SpooledOutput(max_size) as out:
+                proc = app.scatter('query', shards=4, stdout=out)
+                self.assertIs(proc.stdout, out)
+                self.assertEqual(out.spilled, max_size == 4)
+                self.assertEqual([int(i) for i in out.read().split()], [9, 6, 9, 6])
+
+    def test_fail(self):
+        App = dumpling_factory('sh', ['sh', '-c', 'exit 3'], Parameters(ArgmntParam('query')))
+        app = App()
+        app.update(query=self.fasta)
+        with self.assertRaises(CalledProcessError):
+            app.scatter('query', shards=2, tmpdir=self.tmpd)
+        self.assertEqual(os.listdir(self.tmpd), ['seqs.fa'])
+
+
+class FromHelpTests(TestCase):
+    def setUp(self):
+        self.tmpd = mkdtemp()
+        self.log = join(self.tmpd, 'log')
+        self.cmd = join(self.tmpd, 'tool.py')
+        script = '''#!{}
+import argparse
+with open({!r}, 'a') as f:
+    f.write('run\\n')
+parser = argparse.ArgumentParser()
+parser.add_argument('-n', '--num-cpus', type=int, default=2, help='number of CPUs (default: %(default)s)')
+parser.add_argument('--fast', action='store_true', help='run fast')
+parser.add_argument('db', help='the database')
+parser.add_argument('query', nargs='?', help='the query file')
+args = parser.parse_args()
+print(args.num_cpus, args.fast, args.db, args.query)
+'''.format(sys.executable, self.log)
+        with open(self.cmd, 'w') as f:
+            f.write(script)
+        os.chmod(self.cmd, stat.S_IXUSR | stat.S_IRUSR)
+
+    def tearDown(self):
+        rmtree(self.tmpd)
+
+    def runs(self):
+        with open(self.log) as f:
+            return len(f.readlines())
+
+    def test_params(self):
+        App = dumpling_factory.from_help('tool', self.cmd, cache_dir=self.tmpd, threads='-n')
+        app = App()
+        self.assertEqual(list(app.params), ['help', 'num_cpus', 'fast', 'db', 'query'])
+        p = app.params['-n']
+        self.assertEqual((p.flag, p.alter), ('--num-cpus', '-n'))
+        self.assertEqual(p.help, 'number of CPUs (default: 2)')
+        self.assertIsNone(p.value)
+        self.assertEqual(app.params['db'].help, 'the database')
+        app.update(num_cpus=4, fast=True, db='a.cm')
+        self.assertEqual(app.cpus(), 4)
+        self.assertEqual(app().stdout, '4 True a.cm None\n')
+
+    def test_defaults(self):
+        App = dumpling_factory.from_help('tool', self.cmd, cache_dir=self.tmpd, defaults=True)
+        self.assertEqual(App().params['num_cpus'].value, '2')
+
+    def test_cache(self):
+        dumpling_factory.from_help('tool', self.cmd, cache_dir=self.tmpd)
+        dumpling_factory.from_help('tool', self.cmd, cache_dir=self.tmpd)
+        self.assertEqual(self.runs(), 1)
+        # a new version or a changed executable is introspected again
+        dumpling_factory.from_help('tool', self.cmd, version='2', cache_dir=self.tmpd)
+        self.assertEqual(self.runs(), 2)
+        st = os.stat(self.cmd)
+        os.utime(self.cmd, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        dumpling_factory.from_help('tool', self.cmd, cache_dir=self.tmpd)
+        self.assertEqual(self.runs(), 3)
+
+    def test_cache_not_writable(self):
+        # the cache dir can not be created under a file
+        App = dumpling_factory.from_help('tool', self.cmd, cache_dir=join(self.cmd, 'cache'))
+        self.assertIn('db', App().params)
+        cache_dir = join(self.tmpd, 'cache')
+        with patch('os.replace', side_effect=PermissionError):
+            App = dumpling_factory.from_help('tool', self.cmd, cache_dir=cache_dir)
+        self.assertIn('db', App().params)
+        self.assertEqual(os.listdir(cache_dir), [])
+        self.assertEqual(self.runs(), 2)
+
+    def test_gnu(self):
+        gnu = join(self.tmpd, 'gnu')
+        with open(gnu, 'w') as f:
+            f.write('#!/bin/sh\n'
+                    'cat <<EOF\n'
+                    'Usage: gnu [OPTION]... PATTERNS [FILE]...\n'
+                    'Search for PATTERNS in each FILE.\n'
+                    '\n'
+                    'Pattern selection and interpretation:\n'
+                    '  -i, --ignore-case         ignore case distinctions in patterns and data\n'
+                    '      --no-ignore-case      do not ignore case distinctions (default)\n'
+                    '  -m, --max-count=NUM       stop after NUM selected lines\n'
+                    '      --color[=WHEN]        use markers to highlight the matching strings;\n'
+                    '                            WHEN is \'always\', \'never\', or \'auto\' (default: auto)\n'
+                    'EOF\n')
+        os.chmod(gnu, stat.S_IXUSR | stat.S_IRUSR)
+        App = dumpling_factory.from_help('gnu', gnu, cache_dir=self.tmpd, defaults=True)
+        params = App().params
+        self.assertEqual(list(params), ['ignore_case', 'no_ignore_case', 'max_count', 'color', 'patterns', 'file'])
+        self.assertIsNone(params['--no-ignore-case'].value)
+        self.assertEqual((params['-m'].flag, params['-m'].delimiter), ('--max-count', '='))
+        self.assertEqual(params['--color'].value, 'auto')
+
+    def test_missing(self):
+        with self.assertRaises(FileNotFoundError):
+            dumpling_factory.from_help('tool', join(self.tmpd, 'missing'), cache_dir=self.tmpd)
+
+
+class UpToDateTests(TestCase):
+    def setUp(self):
+        self.tmpd = mkdtemp()
+        self.App = dumpling_factory(
+            'copy', 'cp', Parameters(ArgmntParam('src', io='in'), ArgmntParam('dst', io='out')))
+        self.src = join(self.tmpd, 'src')
+        self.dst = join(self.tmpd, 'dst')
+        with open(self.src, 'w') as f:
+            f.write('spam')
+        self.app = self.App()
+        self.app.update(src='src', dst='dst')
+
+    def test_skip(self):
+        self.assertFalse(self.app.up_to_date(cwd=self.tmpd))
+        p = self.app(cwd=self.tmpd)
+        self.assertEqual(p.stdout, '')
+        self.assertTrue(self.app.up_to_date(cwd=self.tmpd))
+        p = self.app(cwd=self.tmpd)
+        self.assertEqual(p.returncode, 0)
+        self.assertIsNone(p.stdout)
+        self.assertIsNone(p.usage)
+        # the input is newer
+        os.utime(self.dst, (0, 0))
+        self.assertFalse(self.app.up_to_date(cwd=self.tmpd))
+        self.assertEqual(self.app(cwd=self.tmpd).stdout, '')
+
+    def test_force(self):
+        self.app(cwd=self.tmpd)
+        self.assertEqual(self.app(cwd=self.tmpd, force=True).stdout, '')
+
+    def test_stdout_path(self):
+        # without a declared output the app always runs
+        app = dumpling_factory('cat', 'cat', Parameters(ArgmntParam('src', io='in')))()
+        app.update(src=self.src)
+        out = join(self.tmpd, 'out')
+        app(stdout=out)
+        self.assertFalse(app.up_to_date(stdout=out))
+        with open(self.src, 'w') as f:
+            f.write('ham')
+        self.assertIsNotNone(app(stdout=out).usage)
+        with open(out) as f:
+            self.assertEqual(f.read(), 'ham')
+        # with a declared output the stdout path is an output too
+        self.app(cwd=self.tmpd, stdout=out)
+        self.assertTrue(self.app.up_to_date(cwd=self.tmpd, stdout=out))
+        os.remove(out)
+        self.assertFalse(self.app.up_to_date(cwd=self.tmpd, stdout=out))
+
+    def tearDown(self):
+        rmtree(self.tmpd)
+
+
+class ResultCacheTests(TestCase):
+    def setUp(self):
+        self.tmpd = mkdtemp()
+        self.log = join(self.tmpd, 'log')
+        # copy the input to the output and log each run
+        self.App = dumpling_factory(
+            'copy', ['sh', '-c', 'cat $0 > $1 && echo $0 && echo run >> $2'],
+            Parameters(ArgmntParam('src', io='in'), ArgmntParam('dst', io='out'),
+                       ArgmntParam('log', self.log)))
+        self.src = join(self.tmpd, 'src')
+        self.dst = join(self.tmpd, 'dst')
+        with open(self.src, 'w') as f:
+            f.write('spam')
+        self.cache = ResultCache(join(self.tmpd, 'cache'))
+
+    def runs(self):
+        with open(self.log) as f:
+            return len(f.readlines())
+
+    def test_hit(self):
+        app = self.App()
+        app.update(src=self.src, dst=self.dst)
+        p = app(cache=self.cache)
+        self.assertEqual(p.stdout, self.src + '\n')
+        os.remove(self.dst)
+        p = app(cache=self.cache)
+        self.assertEqual(p.stdout, self.src + '\n')
+        self.assertEqual(p.args, app.command)
+        self.assertEqual(self.runs(), 1)
+        with open(self.dst) as f:
+            self.assertEqual(f.read(), 'spam')
+
+    def test_miss_on_input_change(self):
+        app = self.App()
+        app.update(src=self.src, dst=self.dst)
+        app(cache=self.cache)
+        with open(self.src, 'w') as f:
+            f.write('ham')
+        app(cache=self.cache)
+        self.assertEqual(self.runs(), 2)
+        self.assertEqual(len(self.cache), 2)
+        with open(self.dst) as f:
+            self.assertEqual(f.read(), 'ham')
+
+    def test_relative_to_cwd(self):
+        app = self.App()
+        app.update(src='src', dst='dst')
+        for i, text in enumerate(['ham', 'eggs']):
+            d = join(self.tmpd, str(i))
+            os.mkdir(d)
+            with open(join(d, 'src'), 'w') as f:
+                f.write(text)
+            app(cwd=d, cache=self.cache, force=True)
+            with open(join(d, 'dst')) as f:
+                self.assertEqual(f.read(), text)
+        self.assertEqual(self.runs(), 2)
+        self.assertEqual(len(self.cache), 2)
+        app(cwd=d, cache=self.cache, force=True)
+        self.assertEqual(self.runs(), 2)
+
+    def test_key_on_streams(self):
+        app = self.App()
+        app.update(src=self.src, dst=self.dst)
+        self.assertIsNone(app(stdout=DEVNULL, cache=self.cache, force=True).stdout)
+        self.assertEqual(app(cache=self.cache, force=True).stdout, self.src + '\n')
+        self.assertEqual(self.runs(), 2)
+        app(stdout=None, cache=self.cache, force=True)
+        self.assertEqual(self.runs(), 3)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_not_cache_pipe_input(self):
+        app = dumpling_factory('cat', 'cat', Parameters(ArgmntParam('file')))()
+        for data in (b'AAA\n', b'BBB\n'):
+            app.update(file=PipeInput(data))
+            self.assertEqual(app(cache=self.cache).stdout, data.decode())
+        self.assertEqual(len(self.cache), 0)
+
+    def test_not_cache_failure(self):
+        app = self.App()
+        app.update(src=join(self.tmpd, 'missing'), dst=self.dst)
+        p = app(check=False, cache=self.cache)
+        self.assertNotEqual(p.returncode, 0)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_evict(self):
+        cache = ResultCache(join(self.tmpd, 'small'))
+        apps = []
+        for i in range(3):
+            app = self.App()
+            app.update(src=self.src, dst=join(self.tmpd, str(i)))
+            apps.append(app)
+        apps[0](cache=cache, force=True)
+        size = sum(os.path.getsize(join(r, f)) for r, _, fs in os.walk(cache.directory) for f in fs)
+        # room for two entries
+        cache.max_size = 2 * size + 10
+        apps[1](cache=cache, force=True)
+        # use the first entry to make the second one least recently used
+        apps[0](cache=cache, force=True)
+        apps[2](cache=cache, force=True)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(self.runs(), 3)
+        apps[0](cache=cache, force=True)
+        self.assertEqual(self.runs(), 3)
+        apps[1](cache=cache, force=True)
+        self.assertEqual(self.runs(), 4)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
     def tearDown(self):
         rmtree(self.tmpd)
 